@@ -36,6 +36,22 @@ pipe_img = pygame.transform.scale2x(pygame.image.load("imgs/pipe.png").convert_a
 bg_img = pygame.transform.scale(pygame.image.load("imgs/bg.png").convert_alpha(), (600, 900))
 bird_imgs = [pygame.transform.scale2x(pygame.image.load("imgs/bird" + str(x) + ".png")) for x in range(1,4)]
 base_img = pygame.transform.scale2x(pygame.image.load("imgs/base.png").convert_alpha())
+pipe_top_img = pygame.transform.flip(pipe_img, False, True)  # flipped once and shared by every pipe
+mask_cache = {}  # collision masks keyed by (image, angle)
+
+
+def get_cached_mask(image, angle=0):
+    """
+    returns the collision mask of an image at a rotation, only building it the first time
+    :param image: pygame surface
+    :param angle: rotation in degrees (int)
+    :return: pygame.mask.Mask
+    """
+    key = (image, angle)
+    if key not in mask_cache:
+        rotated = image if angle == 0 else pygame.transform.rotate(image, angle)
+        mask_cache[key] = pygame.mask.from_surface(rotated)
+    return mask_cache[key]
 
 class Bird:
     """
@@ -129,7 +145,7 @@ class Bird:
         gets the mask for the current image of the bird
         :return: None
         """
-        return pygame.mask.from_surface(self.img)
+        return get_cached_mask(self.img)
 
 class Pipe():
     """
@@ -152,7 +168,7 @@ class Pipe():
         self.top = 0
         self.bottom = 0
 
-        self.PIPE_TOP = pygame.transform.flip(pipe_img, False, True)
+        self.PIPE_TOP = pipe_top_img
         self.PIPE_BOTTOM = pipe_img
 
         self.passed = False
@@ -192,8 +208,12 @@ class Pipe():
         :return: Bool
         """
         bird_mask = bird.get_mask()
-        top_mask = pygame.mask.from_surface(self.PIPE_TOP)
-        bottom_mask = pygame.mask.from_surface(self.PIPE_BOTTOM)
+        # broad phase: no need for the pixel check while the bird is outside the pipe's x-range
+        if self.x >= bird.x + bird_mask.get_size()[0] or self.x + self.PIPE_TOP.get_width() <= bird.x:
+            return False
+
+        top_mask = get_cached_mask(self.PIPE_TOP)
+        bottom_mask = get_cached_mask(self.PIPE_BOTTOM)
         top_offset = (self.x - bird.x, self.top - round(bird.y))
         bottom_offset = (self.x - bird.x, self.bottom - round(bird.y))
 
@@ -252,7 +272,11 @@ class Base:
         :return: Bool
         """
         bird_mask = bird.get_mask()
-        floor_mask = pygame.mask.from_surface(self.IMG)
+        # broad phase: no need for the pixel check while the bird is above the floor
+        if round(bird.y) + bird_mask.get_size()[1] <= self.y:
+            return False
+
+        floor_mask = get_cached_mask(self.IMG)
         floor_offset = (self.x1 - bird.x, self.y - round(bird.y))
 
         f_point = bird_mask.overlap(floor_mask, floor_offset)
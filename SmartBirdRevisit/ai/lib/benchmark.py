@@ -0,0 +1,126 @@
+"""
+Benchmarks of the network's forward pass on observations from real game frames
+Author: Kevin Lee
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))         # Run from anywhere: python lib/benchmark.py
+from lib import neural_network
+from lib import observation
+from lib import script
+
+
+def sample_observations(count, seed, raster=None):
+    """
+    The first count raw uint8 observations of observation.random_play, consecutive within each episode.
+    """
+    frames = np.empty((count, observation.PIXEL_COUNT), dtype=np.uint8)
+    played = observation.random_play(seed=seed, raster=raster, out=np.empty(observation.PIXEL_COUNT, dtype=np.uint8))
+    for frame, observed in zip(frames, played):
+        frame[...] = observed
+    return frames
+
+
+def random_thought_process(no_inputs, no_neurons, seed):
+    rng = np.random.default_rng(seed)
+    return {
+        'hidden_weights': rng.standard_normal((no_inputs, no_neurons)),
+        'hidden_biases': rng.standard_normal((1, no_neurons)),
+        'output_weights': rng.standard_normal((no_neurons, 2)),
+        'output_biases': rng.standard_normal((1, 2))
+    }
+
+
+def timed(step, states):
+    # step on every state in order, as in a game; returns the results as an array and the seconds per step
+    start = time.perf_counter()
+    results = np.array([step(state) for state in states])
+    return results, (time.perf_counter() - start) / len(states)
+
+
+def forward_jump(model):
+    # A step that decides with the plain forward pass rather than model.decide
+    def step(state):
+        q_values = model.forward(state)
+        return q_values[0][0] > q_values[0][1]
+    return step
+
+
+def benchmark_precision(args):
+    """
+    Forward pass time and action agreement with float64 for each storage / compute precision, on float and uint8 inputs.
+    """
+    frames = sample_observations(args.frames, args.seed)
+    scaled = frames / 255.0
+    print(f"{args.frames} frames, {args.neurons} hidden neurons, {args.models} random float64 models")
+    print(f"{'inputs':<7}{'storage':<9}{'compute':<9}{'us/pass':>9}{'speedup':>9}{'agreement':>11}{'stored MB':>11}")
+    configurations = [(uint8, storage, compute) for uint8 in (False, True)
+                      for storage, compute in (('float64', 'float64'), ('float32', 'float32'), ('float16', 'float32'), ('float64', 'float32'))]
+    results = {configuration: [0.0, 0.0] for configuration in configurations}
+    for model_index in range(args.models):
+        thought_process = random_thought_process(observation.PIXEL_COUNT, args.neurons, args.seed + model_index)
+        reference, _ = timed(forward_jump(neural_network.model(False, thought_process, args.neurons, observation.PIXEL_COUNT)), scaled)
+        for uint8, storage, compute in configurations:
+            model = neural_network.model(False, thought_process, args.neurons, observation.PIXEL_COUNT, uint8, storage, compute)
+            jumps, seconds = timed(forward_jump(model), frames if uint8 else scaled)
+            results[(uint8, storage, compute)][0] += seconds / args.models
+            results[(uint8, storage, compute)][1] += np.mean(jumps == reference) / args.models
+    baseline = results[(False, 'float64', 'float64')][0]
+    for (uint8, storage, compute), (seconds, agreement) in results.items():
+        stored = observation.PIXEL_COUNT * args.neurons * np.dtype(storage).itemsize / 2 ** 20
+        print(f"{'uint8' if uint8 else 'float':<7}{storage:<9}{compute:<9}{seconds * 1e6:>9.1f}{baseline / seconds:>8.2f}x{agreement:>10.2%}{stored:>11.2f}")
+
+
+def benchmark_incremental(args):
+    """
+    Full vs incremental (delta) hidden layer evaluation over consecutive frames: time per decision and action agreement.
+    """
+    raster = observation.rasterizer()
+    frames = sample_observations(args.frames, args.seed, raster)
+    background = np.rint(raster.background).reshape(-1).astype(np.uint8)
+    changed = np.mean(np.count_nonzero(frames[1:] != frames[:-1], axis=1))
+    print(f"{args.frames} frames, {args.neurons} hidden neurons, {changed:.0f} of {observation.PIXEL_COUNT} pixels change per frame on average")
+    print(f"{'inputs':<7}{'full us':>9}{'delta us':>10}{'speedup':>9}{'agreement':>11}")
+    for uint8 in (False, True):
+        states = frames if uint8 else frames / 255.0
+        full_seconds = delta_seconds = agreement = 0.0
+        for model_index in range(args.models):
+            thought_process = random_thought_process(observation.PIXEL_COUNT, args.neurons, args.seed + model_index)
+            full = neural_network.model(False, thought_process, args.neurons, observation.PIXEL_COUNT, uint8)
+            reference, seconds = timed(full.decide, states)
+            full_seconds += seconds / args.models
+            delta = neural_network.model(False, thought_process, args.neurons, observation.PIXEL_COUNT, uint8)
+            delta.incremental(background if uint8 else background / 255.0)
+            jumps, seconds = timed(delta.decide, states)
+            delta_seconds += seconds / args.models
+            agreement += np.mean(jumps == reference) / args.models
+        print(f"{'uint8' if uint8 else 'float':<7}{full_seconds * 1e6:>9.1f}{delta_seconds * 1e6:>10.1f}{full_seconds / delta_seconds:>8.2f}x{agreement:>10.2%}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the smart bird network")
+    commands = parser.add_subparsers(dest='command', required=True)
+    precision = commands.add_parser('precision', help="float64 vs float32 vs float16 forward passes")
+    precision.add_argument('--neurons', type=int, default=32, help="number of hidden neurons")
+    precision.add_argument('--frames', type=int, default=2000, help="observations per model")
+    precision.add_argument('--models', type=int, default=5, help="random models to average over")
+    precision.add_argument('--seed', type=int, default=0)
+    precision.set_defaults(run=benchmark_precision)
+    incremental = commands.add_parser('incremental', help="full vs incremental hidden layer evaluation")
+    incremental.add_argument('--neurons', type=int, default=32, help="number of hidden neurons")
+    incremental.add_argument('--frames', type=int, default=2000, help="consecutive observations per model")
+    incremental.add_argument('--models', type=int, default=5, help="random models to average over")
+    incremental.add_argument('--seed', type=int, default=0)
+    incremental.set_defaults(run=benchmark_incremental)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    script.setup()
+    args = parse_args()
+    args.run(args)
@@ -0,0 +1,142 @@
+"""
+Background, incremental checkpointing of the best thought processes
+Author: Kevin Lee
+"""
+import atexit
+import os
+import pickle
+import re
+import threading
+import time
+
+from lib.population import parameters_of
+
+INDEX_FILE = "index.pkl"
+INDIVIDUAL_FILE = re.compile(r"tp_(\d+)\.pkl")                                              # One file per individual, numbered across runs
+
+
+def write_atomic(path, obj):
+    """
+    Pickle obj to path through a temporary file and a rename, so a crash never leaves a half-written file behind.
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        pickle.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def load(directory):
+    """
+    The ranked thought processes of a checkpoint directory, in the same format thought_process.save pickles.
+    """
+    with open(os.path.join(directory, INDEX_FILE), "rb") as f:
+        index = pickle.load(f)
+    thought_processes = []
+    for entry in index:
+        if entry['file'] is None:
+            thought_processes.append({'fitness_score': entry['fitness_score']})
+            continue
+        with open(os.path.join(directory, entry['file']), "rb") as f:
+            thought_process = pickle.load(f)
+        thought_process['fitness_score'] = entry['fitness_score']
+        thought_processes.append(thought_process)
+    return thought_processes
+
+
+class checkpoint_writer:
+    """
+    CHECKPOINT WRITER:
+    Saves the best thought processes from a background thread. Each individual is written once to its own file, and only a small
+    ranked index is rewritten when the population changes. Saves are coalesced to at most one per interval and flushed on exit,
+    so a crash loses at most one interval of progress.
+    """
+    # CONSTRUCTOR: directory holds the individual files and the index; interval is in seconds (0 writes as soon as possible)
+    def __init__(self, directory, interval=5.0):
+        self.directory = directory
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        self.pending = None
+        self.written = {}                                                                   # Parameter identity -> file name, for the individuals on disk
+        # Number past every file already there, so a new run never overwrites one the previous run's index may still point to
+        self.next_file = 1 + max((int(match.group(1)) for match in map(INDIVIDUAL_FILE.fullmatch, os.listdir(directory)) if match), default=-1)
+        self.last_write = 0.0
+        self.stopped = False
+        self.error = None
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name="checkpoint-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # SUBMIT: queue the latest population; only the newest submission is written when the interval comes round
+    def submit(self, thought_processes):
+        if self.error is not None:
+            raise self.error
+        snapshot = [dict(thought_process) for thought_process in thought_processes]     # Parameter arrays are never modified in place, only replaced
+        with self.condition:
+            self.pending = snapshot
+            self.condition.notify()
+
+    # FLUSH: write whatever is pending now and wait for it
+    def flush(self):
+        with self.condition:
+            snapshot, self.pending = self.pending, None
+        if snapshot is not None:
+            self.write(snapshot)
+
+    # CLOSE: stop the thread and flush
+    def close(self):
+        with self.condition:
+            if self.stopped:
+                return
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+        self.flush()
+
+    # RUN: background loop, one coalesced write per interval at most
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                delay = self.last_write + self.interval - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)                                              # Later submissions replace pending meanwhile
+                    continue
+                snapshot, self.pending = self.pending, None
+            try:
+                self.write(snapshot)
+            except Exception as error:                                                      # Surfaced on the next submit
+                self.error = error
+                return
+
+    # WRITE: new or changed individuals get their own file, then the index is swapped in and every individual file it does not
+    # reference is removed (dropped individuals, a previous run's files, leftovers of a crash)
+    def write(self, snapshot):
+        index = []
+        kept = {}
+        for thought_process in snapshot:
+            if 'hidden_weights' not in thought_process:
+                index.append({'file': None, 'fitness_score': thought_process['fitness_score']})
+                continue
+            key = tuple(id(thought_process[name]) for name in parameters_of(thought_process))
+            if key in self.written:
+                file_name = self.written[key][0]
+            else:
+                file_name = f"tp_{self.next_file}.pkl"
+                self.next_file += 1
+                write_atomic(os.path.join(self.directory, file_name), {name: thought_process[name] for name in parameters_of(thought_process)})
+            kept[key] = (file_name, thought_process)                                        # Holding the arrays keeps their ids from being reused
+            index.append({'file': file_name, 'fitness_score': thought_process['fitness_score']})
+        write_atomic(os.path.join(self.directory, INDEX_FILE), index)
+
+        kept_files = {file_name for file_name, _ in kept.values()}
+        for file_name in os.listdir(self.directory):
+            if INDIVIDUAL_FILE.fullmatch(file_name) and file_name not in kept_files:
+                os.remove(os.path.join(self.directory, file_name))
+        self.written = kept
+        self.last_write = time.monotonic()
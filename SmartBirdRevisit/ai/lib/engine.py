@@ -0,0 +1,451 @@
+"""
+Headless simulation core: pure game state (positions, velocities, pipe heights, score) with no display, clock or surfaces
+Author: Kevin Lee
+"""
+import random
+import numpy as np
+
+# --- Constants ---
+WIN_WIDTH = 600
+WIN_HEIGHT = 800
+FLOOR_Y = 730
+CEILING_Y = -220                                                                            # The bird is considered lost once it flies this far above the screen
+
+BIRD_START_X = 210
+BIRD_START_Y = 350
+PIPE_START_X = 700
+
+# Sprite dimensions after pygame.transform.scale2x, so the core never has to load an image to know them
+BIRD_WIDTH = 68
+BIRD_HEIGHT = 48
+PIPE_WIDTH = 104
+PIPE_HEIGHT = 640
+BASE_WIDTH = 672
+
+PASS_REWARD = 500                                                                           # Reward for passing a pipe
+SURVIVAL_REWARD = 1                                                                         # Reward for every tick survived
+
+PIPE_MIN_HEIGHT = 50
+PIPE_MAX_HEIGHT = 450                                                                       # Exclusive, as in random.randrange(50, 450)
+MAX_PIPES = 3                                                                               # At most three pipes are ever on screen at once (the 700px start pipe plus two spawned at WIN_WIDTH)
+SCHEDULE_CHUNK = 64                                                                         # Pipe schedules grow in fixed chunks so a seed always yields the same heights
+
+
+# --- Collision ---
+# Analytic collision: the bird is a box tested against the pipe rectangles with plain arithmetic, on scalars or NumPy arrays.
+# Boxes are (left, top, right, bottom) relative to the bird sprite's top-left corner, which sits at (bird.x, round(bird.y)) like the masks.
+BIRD_SPRITE_BOX = (0, 0, BIRD_WIDTH, BIRD_HEIGHT)                                          # Contains every opaque pixel of all three frames: no overlap here means no pixel collision
+BIRD_CORE_BOX = (13, 8, 55, 44)                                                             # Opaque in all three frames: an overlap here is always a pixel collision
+BIRD_HITBOX = (4, 4, 64, 44)                                                                # Analytic hitbox, see box_collide for its tolerance
+PIPE_LIP_HEIGHT = 48                                                                        # The pipe's lip (next to the gap) is the full sprite width...
+PIPE_BODY_INSET = 4                                                                         # ...the rest of the pipe is 4px narrower on each side
+
+
+def box_collide(bird_x, bird_y, pipe_x, pipe_height, box=BIRD_HITBOX):
+    """
+    Collision between a bird box and the full pipe sprite rectangles (the gap is [pipe_height, pipe_height + GAP)).
+    Tolerance versus pixel-perfect masks, measured over every bird frame and pipe offset: with BIRD_HITBOX it can miss a graze
+    of at most 4px at the sprite's rounded corners, and can report a hit while the opaque pixels are still up to 7px clear.
+    Use BIRD_SPRITE_BOX to never miss a pixel collision (it reports hits up to 11px early instead).
+    """
+    left, top, right, bottom = box
+    bird_top = np.round(bird_y)                                                             # Masks are placed at round(bird.y), so the boxes are too
+    overlap_x = (pipe_x < bird_x + right) & (pipe_x + PIPE_WIDTH > bird_x + left)
+    outside_gap = (bird_top + top < pipe_height) | (bird_top + bottom > pipe_height + Pipe.GAP)
+    return overlap_x & outside_gap
+
+
+def core_collide(bird_x, bird_y, pipe_x, pipe_height):
+    """
+    Certain collision: the bird's always-opaque core overlaps an opaque part of the pipe (the lip, or the inset body).
+    """
+    left, top, right, bottom = BIRD_CORE_BOX
+    bird_left = bird_x + left
+    bird_right = bird_x + right
+    bird_top = np.round(bird_y) + top
+    bird_bottom = np.round(bird_y) + bottom
+    gap_bottom = pipe_height + Pipe.GAP
+
+    lip_x = (pipe_x < bird_right) & (pipe_x + PIPE_WIDTH > bird_left)
+    body_x = (pipe_x + PIPE_BODY_INSET < bird_right) & (pipe_x + PIPE_WIDTH - PIPE_BODY_INSET > bird_left)
+    lip_y = ((bird_top < pipe_height) & (bird_bottom > pipe_height - PIPE_LIP_HEIGHT)) | \
+            ((bird_bottom > gap_bottom) & (bird_top < gap_bottom + PIPE_LIP_HEIGHT))
+    body_y = (bird_top < pipe_height - PIPE_LIP_HEIGHT) | (bird_bottom > gap_bottom + PIPE_LIP_HEIGHT)
+    return (lip_x & lip_y) | (body_x & body_y)
+
+
+def near_miss(bird_x, bird_y, pipe_x, pipe_height):
+    """
+    Frames the boxes cannot decide exactly: the sprite box touches the pipe but the opaque core does not.
+    Only these need a pixel-perfect check.
+    """
+    return box_collide(bird_x, bird_y, pipe_x, pipe_height, BIRD_SPRITE_BOX) & ~core_collide(bird_x, bird_y, pipe_x, pipe_height)
+
+
+# --- Classes ---
+class Bird:
+    MAX_ROTATION = 25
+    ROT_VEL = 20
+    ANIMATION_TIME = 5
+    WIDTH = BIRD_WIDTH
+    HEIGHT = BIRD_HEIGHT
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        self.tilt = 0
+        self.tick_count = 0
+        self.velocity = 0
+        self.height = y
+        self.img_count = 0
+        self.frame = 0                                                                      # Index of the wing animation sprite (bird1, bird2, bird3)
+
+    def jump(self):
+        self.velocity = 7.7
+        self.tick_count = 0
+        self.height = self.y
+
+    def update_position(self):
+        direction = 1 if self.velocity >= 0 else -1
+        displacement = (self.velocity ** 2) * 0.6 * direction if self.velocity > -7 else 20 * 1.25
+        self.y -= displacement
+        self.velocity -= 1.1
+
+        if self.y < self.height and self.tilt < self.MAX_ROTATION:
+            self.tilt = self.MAX_ROTATION
+        elif self.y >= self.height and self.tilt > -90:
+            self.tilt -= self.ROT_VEL
+
+    def animate(self):
+        """
+        Advance the wing flap by one frame. The animation frame decides which sprite (and so which mask) the bird uses.
+        """
+        self.img_count += 1
+        if self.img_count <= self.ANIMATION_TIME:
+            self.frame = 0
+        elif self.img_count <= self.ANIMATION_TIME * 2:
+            self.frame = 1
+        elif self.img_count <= self.ANIMATION_TIME * 3:
+            self.frame = 2
+        elif self.img_count <= self.ANIMATION_TIME * 4:
+            self.frame = 1
+        else:
+            self.frame = 0
+            self.img_count = 0
+
+        if self.tilt <= -80:
+            self.frame = 1
+            self.img_count = self.ANIMATION_TIME * 2
+
+
+class Pipe:
+    GAP = 200
+    VELOCITY = 8
+    WIDTH = PIPE_WIDTH
+    HEIGHT = PIPE_HEIGHT
+
+    def __init__(self, x, height=None):
+        self.x = x
+        self.height = 0
+        self.top = 0
+        self.bottom = 0
+        self.passed = False
+        self.set_height(height)
+
+    def set_height(self, height=None):
+        self.height = random.randrange(50, 450) if height is None else height
+        self.top = self.height - self.HEIGHT
+        self.bottom = self.height + self.GAP
+
+    def update_position(self):
+        self.x -= self.VELOCITY
+
+
+class Base:
+    VELOCITY = 8
+    WIDTH = BASE_WIDTH
+
+    def __init__(self, y):
+        self.y = y
+        self.x1 = 0
+        self.x2 = self.WIDTH
+
+    def update_position(self):
+        self.x1 -= self.VELOCITY
+        self.x2 -= self.VELOCITY
+        if self.x1 + self.WIDTH < 0:
+            self.x1 = self.x2 + self.WIDTH
+        if self.x2 + self.WIDTH < 0:
+            self.x2 = self.x1 + self.WIDTH
+
+
+class PipeSchedule:
+    """
+    PIPE SCHEDULE:
+    The gap heights of one course, precomputed from an explicit seed. Every game playing the same schedule sees the same pipes,
+    so candidates evaluated on it are compared on equal terms (common random numbers).
+    """
+    # CONSTRUCTOR: seed is anything np.random.default_rng accepts, e.g. [run_seed, epoch]
+    def __init__(self, seed):
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.heights = np.empty(0, dtype=np.int64)
+        self.reserve(SCHEDULE_CHUNK)
+
+    # RESERVE: make sure the first length heights exist, drawing more in whole chunks from the same stream
+    def reserve(self, length):
+        while len(self.heights) < length:
+            chunk = self.rng.integers(PIPE_MIN_HEIGHT, PIPE_MAX_HEIGHT, size=SCHEDULE_CHUNK)
+            self.heights = np.concatenate([self.heights, chunk])
+
+    # HEIGHT: gap height of the index-th pipe of the course (index 0 is the start pipe)
+    def height(self, index):
+        self.reserve(index + 1)
+        return int(self.heights[index])
+
+    # HEIGHTS: vectorized height() for an array of pipe indices
+    def heights_at(self, indices):
+        if len(indices):
+            self.reserve(int(indices.max()) + 1)
+        return self.heights[indices]
+
+
+class World:
+    """
+    WORLD:
+    One game of smart bird. Steps the bird, base and pipes exactly like the original per-frame loop, without drawing anything.
+    """
+    # CONSTRUCTOR: collide(bird, pipe) decides pipe collisions, so the caller chooses how exact (and how expensive) that check is.
+    # With a PipeSchedule the pipe heights come from it instead of the global random module
+    def __init__(self, collide, schedule=None):
+        self.collide = collide
+        self.schedule = schedule
+        self.reset()
+
+    # RESET: put the bird back at its starting position in front of a single fresh pipe
+    def reset(self):
+        self.bird = Bird(BIRD_START_X, BIRD_START_Y)
+        self.base = Base(FLOOR_Y)
+        self.pipes_spawned = 0
+        self.pipes = [self.new_pipe(PIPE_START_X)]
+        self.score = 0
+        self.alive = True
+
+    # NEW PIPE: the next pipe of the course
+    def new_pipe(self, x):
+        height = None if self.schedule is None else self.schedule.height(self.pipes_spawned)
+        self.pipes_spawned += 1
+        return Pipe(x, height)
+
+    # ACTIVE PIPE: index of the pipe the bird still has to get through
+    def active_pipe_index(self):
+        if len(self.pipes) > 1 and self.bird.x > self.pipes[0].x + Pipe.WIDTH:
+            return 1
+        return 0
+
+    # PLAYING: the bird is lost once it hits the floor or flies off the top of the screen
+    def playing(self):
+        if self.bird.y + Bird.HEIGHT >= FLOOR_Y or self.bird.y < CEILING_Y:
+            self.alive = False
+        return self.alive
+
+    # STEP: advance one tick, apply the decided jump and count the survival reward. Returns whether the bird is still alive
+    def step(self, jump):
+        self.bird.update_position()
+        self.base.update_position()
+
+        should_add_pipe = False
+        pipes_to_remove = []
+
+        for pipe in self.pipes:
+            pipe.update_position()
+            if self.collide(self.bird, pipe):
+                self.alive = False
+                break
+
+            if pipe.x + Pipe.WIDTH < 0:
+                pipes_to_remove.append(pipe)
+
+            if not pipe.passed and pipe.x < self.bird.x:
+                self.score += PASS_REWARD
+                pipe.passed = True
+                should_add_pipe = True
+
+        if should_add_pipe:
+            self.pipes.append(self.new_pipe(WIN_WIDTH))
+
+        for pipe in pipes_to_remove:
+            self.pipes.remove(pipe)
+
+        if jump:
+            self.bird.jump()
+
+        self.score += SURVIVAL_REWARD
+        self.bird.animate()                                                                 # The original loop advanced the animation while drawing, after collisions were checked
+        return self.alive
+
+
+class WorldBatch:
+    """
+    WORLD BATCH:
+    N independent games kept as NumPy arrays (struct of arrays) and advanced together in one vectorized step.
+    Bird.update_position, Pipe.update_position and World.step are the reference semantics; finished games restart automatically.
+    """
+    # CONSTRUCTOR: size worlds, each with up to MAX_PIPES pipe slots kept in spawn order (slot 0 is the oldest pipe). Pipes collide analytically with box.
+    # With a PipeSchedule every episode of every world plays the same course; otherwise heights are drawn from rng
+    def __init__(self, size, rng=None, box=BIRD_HITBOX, schedule=None):
+        self.size = size
+        self.box = box
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.schedule = schedule
+        self.pipes_spawned = np.zeros(size, dtype=np.int64)                                 # Per world, index of the next pipe in the schedule
+
+        self.bird_y = np.zeros(size)
+        self.velocity = np.zeros(size)
+        self.tilt = np.zeros(size)
+        self.jump_y = np.zeros(size)                                                        # Bird.height: the y the last jump started from
+        self.img_count = np.zeros(size, dtype=np.int64)
+        self.frame = np.zeros(size, dtype=np.int64)
+
+        self.pipe_x = np.zeros((size, MAX_PIPES))
+        self.pipe_height = np.zeros((size, MAX_PIPES), dtype=np.int64)
+        self.pipe_passed = np.zeros((size, MAX_PIPES), dtype=bool)
+        self.pipe_active = np.zeros((size, MAX_PIPES), dtype=bool)
+
+        self.base_x1 = np.zeros(size)
+        self.base_x2 = np.zeros(size)
+
+        self.score = np.zeros(size, dtype=np.int64)
+        self.alive = np.ones(size, dtype=bool)
+        self.reset(np.ones(size, dtype=bool))
+
+    # RESET: restart the masked worlds with a fresh bird in front of a single new pipe
+    def reset(self, mask):
+        if not mask.any():
+            return
+        self.bird_y[mask] = BIRD_START_Y
+        self.velocity[mask] = 0
+        self.tilt[mask] = 0
+        self.jump_y[mask] = BIRD_START_Y
+        self.img_count[mask] = 0
+        self.frame[mask] = 0
+
+        self.pipe_x[mask] = 0
+        self.pipe_height[mask] = 0
+        self.pipe_passed[mask] = False
+        self.pipe_active[mask] = False
+        self.pipe_x[mask, 0] = PIPE_START_X
+        self.pipes_spawned[mask] = 0
+        self.pipe_height[mask, 0] = self.new_pipe_heights(mask)
+        self.pipe_active[mask, 0] = True
+
+        self.base_x1[mask] = 0
+        self.base_x2[mask] = BASE_WIDTH
+
+        self.score[mask] = 0
+        self.alive[mask] = True
+
+    # NEW PIPE HEIGHTS: one gap height per masked world, the next one of the schedule or a random one in the range of Pipe.set_height
+    def new_pipe_heights(self, mask):
+        if self.schedule is None:
+            return self.rng.integers(PIPE_MIN_HEIGHT, PIPE_MAX_HEIGHT, size=int(np.count_nonzero(mask)))
+        heights = self.schedule.heights_at(self.pipes_spawned[mask])
+        self.pipes_spawned[mask] += 1
+        return heights
+
+    # ACTIVE PIPE: per world, the slot of the pipe the bird still has to get through (see World.active_pipe_index)
+    def active_pipe_index(self):
+        behind = self.pipe_active[:, 1] & (BIRD_START_X > self.pipe_x[:, 0] + PIPE_WIDTH)
+        return behind.astype(np.int64)
+
+    # STEP: advance every world one tick with the decided jumps.
+    # Returns (done, final_scores): which worlds finished this tick and what they scored; those worlds are reset before returning
+    def step(self, jump):
+        # Out of bounds before moving: finished without scoring this tick (World.playing)
+        done = (self.bird_y + BIRD_HEIGHT >= FLOOR_Y) | (self.bird_y < CEILING_Y)
+        moving = ~done
+
+        self._update_birds(moving)
+        self.base_x1[moving] -= Base.VELOCITY
+        self.base_x2[moving] -= Base.VELOCITY
+        wrap = moving & (self.base_x1 + BASE_WIDTH < 0)
+        self.base_x1[wrap] = self.base_x2[wrap] + BASE_WIDTH
+        wrap = moving & (self.base_x2 + BASE_WIDTH < 0)
+        self.base_x2[wrap] = self.base_x1[wrap] + BASE_WIDTH
+
+        # Pipes move, collide, retire and score in slot (list) order; a collision stops the pipe loop like the break in World.step
+        self.pipe_x[moving] -= np.where(self.pipe_active[moving], Pipe.VELOCITY, 0)
+        collided = self.pipe_active & moving[:, None] & box_collide(
+            BIRD_START_X, self.bird_y[:, None], self.pipe_x, self.pipe_height, self.box
+        )
+        blocked = np.cumsum(collided, axis=1) > 0                                           # Slots at or after the first collision are never reached
+        reached = self.pipe_active & moving[:, None] & ~blocked
+        passing = reached & ~self.pipe_passed & (self.pipe_x < BIRD_START_X)
+        self.pipe_passed |= passing
+        passes = np.count_nonzero(passing, axis=1)
+        self.score += passes * PASS_REWARD
+        crashed = collided.any(axis=1)
+
+        # Retire pipes that have left the screen (only ever the oldest), then spawn one new pipe per world that passed one
+        retire = reached[:, 0] & (self.pipe_x[:, 0] + PIPE_WIDTH < 0)
+        self._retire_oldest(retire)
+        self._spawn(passes > 0)
+
+        jumping = moving & np.asarray(jump, dtype=bool)
+        self.velocity[jumping] = 7.7
+        self.jump_y[jumping] = self.bird_y[jumping]
+
+        self.score[moving] += SURVIVAL_REWARD
+        self._animate(moving)
+
+        done |= crashed
+        self.alive = ~done
+        final_scores = self.score.copy()
+        self.reset(done)
+        return done, final_scores
+
+    # --- Vectorized counterparts of the per-object methods ---
+    def _update_birds(self, mask):
+        velocity = self.velocity[mask]
+        direction = np.where(velocity >= 0, 1, -1)
+        displacement = np.where(velocity > -7, (velocity ** 2) * 0.6 * direction, 20 * 1.25)
+        bird_y = self.bird_y[mask] - displacement
+        self.bird_y[mask] = bird_y
+        self.velocity[mask] = velocity - 1.1
+
+        tilt = self.tilt[mask]
+        rising = (bird_y < self.jump_y[mask]) & (tilt < Bird.MAX_ROTATION)
+        falling = ~rising & (bird_y >= self.jump_y[mask]) & (tilt > -90)
+        tilt = np.where(rising, Bird.MAX_ROTATION, np.where(falling, tilt - Bird.ROT_VEL, tilt))
+        self.tilt[mask] = tilt
+
+    def _animate(self, mask):
+        img_count = self.img_count + mask
+        frame = np.select(
+            [img_count <= Bird.ANIMATION_TIME, img_count <= Bird.ANIMATION_TIME * 2,
+             img_count <= Bird.ANIMATION_TIME * 3, img_count <= Bird.ANIMATION_TIME * 4],
+            [0, 1, 2, 1], default=0
+        )
+        img_count = np.where(img_count > Bird.ANIMATION_TIME * 4, 0, img_count)
+        nose_dive = self.tilt <= -80
+        frame = np.where(nose_dive, 1, frame)
+        img_count = np.where(nose_dive, Bird.ANIMATION_TIME * 2, img_count)
+        self.img_count = np.where(mask, img_count, self.img_count)
+        self.frame = np.where(mask, frame, self.frame)
+
+    def _retire_oldest(self, mask):
+        if not mask.any():
+            return
+        for slots in (self.pipe_x, self.pipe_height, self.pipe_passed, self.pipe_active):
+            slots[mask, :-1] = slots[mask, 1:]
+        self.pipe_active[mask, -1] = False
+
+    def _spawn(self, mask):
+        if not mask.any():
+            return
+        slot = np.count_nonzero(self.pipe_active[mask], axis=1)                             # First free slot keeps spawn order
+        rows = np.flatnonzero(mask)
+        self.pipe_x[rows, slot] = WIN_WIDTH
+        self.pipe_height[rows, slot] = self.new_pipe_heights(mask)
+        self.pipe_passed[rows, slot] = False
+        self.pipe_active[rows, slot] = True
@@ -0,0 +1,128 @@
+"""
+Low-rank factorization of the hidden layer: convert saved thought processes by truncated SVD and report how often their actions still agree
+Author: Kevin Lee
+"""
+import argparse
+import os
+import pickle
+import sys
+import numpy as np
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))         # Run from anywhere: python lib/factorize.py
+from lib import benchmark
+from lib import neural_network
+from lib import observation
+from lib import script
+
+
+def sample_states(episodes, seed=0):
+    """
+    Observations (0-1 scale, one row per frame) of episodes of observation.random_play, as pruning.profile sees them.
+    """
+    return np.array(list(observation.random_play(episodes, seed)))
+
+
+def build_model(thought_process):
+    # A float64 model of a dense or factorized thought process, sized from its weights
+    no_inputs = np.shape(thought_process.get('hidden_basis', thought_process['hidden_weights']))[0]
+    return neural_network.model(False, thought_process, np.shape(thought_process['hidden_biases'])[-1], no_inputs)
+
+
+def decisions(thought_process, states):
+    # Jump decisions of a thought process on every state, in one batched forward pass
+    q_values = build_model(thought_process).forward(states)
+    return q_values[:, 0] > q_values[:, 1]
+
+
+def seconds_per_decision(thought_process, states):
+    # model.decide on every state in order, as in a game
+    return benchmark.timed(build_model(thought_process).decide, states)[1]
+
+
+def stored_size(thought_process):
+    # Bytes of weights and biases
+    return sum(np.asarray(value).nbytes for key, value in thought_process.items() if key != 'fitness_score')
+
+
+def load_weighted(path):
+    # The thought processes of a log.pkl / best.pkl that carry weights, checked against the full pixel observation
+    with open(path, "rb") as f:
+        thought_processes = pickle.load(f)
+    for thought_process in thought_processes:
+        if 'hidden_weights' in thought_process:
+            no_inputs = np.shape(thought_process.get('hidden_basis', thought_process['hidden_weights']))[0]
+            if no_inputs != observation.PIXEL_COUNT:
+                raise ValueError(f"{path} holds thought processes with {no_inputs} inputs, expected the full {observation.PIXEL_COUNT} (factorize before pruning)")
+    return thought_processes
+
+
+def convert(args):
+    """
+    Factorize every thought process of a pickle and write them out, with each one's action agreement and size.
+    """
+    thought_processes = load_weighted(args.input)
+    states = sample_states(args.episodes, args.seed)
+    converted = []
+    for index, thought_process in enumerate(thought_processes):
+        if 'hidden_weights' not in thought_process:
+            converted.append(thought_process)
+            continue
+        factorized = neural_network.thought_process.factorize(thought_process, args.rank)
+        agreement = np.mean(decisions(factorized, states) == decisions(thought_process, states))
+        print(f"{index:>3}: fitness {thought_process['fitness_score']:>6} agreement {agreement:>8.2%}"
+              f"  {stored_size(thought_process) / 2 ** 10:>8.1f} KB -> {stored_size(factorized) / 2 ** 10:.1f} KB")
+        converted.append(factorized)
+    with open(args.output, "wb") as f:
+        pickle.dump(converted, f)
+    print(f"{len(states)} frames compared, rank {args.rank} thought processes written to {args.output}")
+
+
+def report(args):
+    """
+    Mean action agreement, decision time and size of every thought process of a pickle, factorized to each rank.
+    """
+    thought_processes = [tp for tp in load_weighted(args.input) if 'hidden_weights' in tp]
+    states = sample_states(args.episodes, args.seed)
+    dense = [neural_network.thought_process.dense(tp) for tp in thought_processes]
+    references = [decisions(tp, states) for tp in dense]
+    timed = states[:args.timed_frames]
+    dense_seconds = np.mean([seconds_per_decision(tp, timed) for tp in dense])
+    dense_size = np.mean([stored_size(tp) for tp in dense])
+    print(f"{len(thought_processes)} thought processes, {len(states)} frames")
+    print(f"{'rank':<7}{'agreement':>11}{'us/decision':>13}{'speedup':>9}{'KB':>9}")
+    print(f"{'dense':<7}{1:>11.2%}{dense_seconds * 1e6:>13.1f}{1:>8.2f}x{dense_size / 2 ** 10:>9.1f}")
+    for rank in args.ranks:
+        factorized = [neural_network.thought_process.factorize(tp, rank) for tp in dense]
+        agreement = np.mean([np.mean(decisions(tp, states) == reference) for tp, reference in zip(factorized, references)])
+        seconds = np.mean([seconds_per_decision(tp, timed) for tp in factorized])
+        size = np.mean([stored_size(tp) for tp in factorized])
+        print(f"{rank:<7}{agreement:>11.2%}{seconds * 1e6:>13.1f}{dense_seconds / seconds:>8.2f}x{size / 2 ** 10:>9.1f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Factorize the hidden layer of saved thought processes by truncated SVD")
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert_command = commands.add_parser('convert', help="write a pickle of thought processes (e.g. best.pkl) factorized to a rank")
+    convert_command.add_argument('input')
+    convert_command.add_argument('output')
+    convert_command.add_argument('--rank', type=int, required=True)
+    convert_command.set_defaults(run=convert)
+    report_command = commands.add_parser('report', help="action agreement, speed and size of a pickle factorized to several ranks")
+    report_command.add_argument('input', nargs='?', default="saved_tp/best.pkl")
+    report_command.add_argument('--ranks', type=int, nargs='+', default=[2, 4, 8, 16])
+    report_command.add_argument('--timed-frames', type=int, default=500, help="frames each model.decide timing runs over")
+    report_command.set_defaults(run=report)
+    for command in (convert_command, report_command):
+        command.add_argument('--episodes', type=int, default=50, help="sample episodes the actions are compared on")
+        command.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if (args.rank if args.command == 'convert' else min(args.ranks)) < 1:
+        parser.error("ranks must be at least 1")
+    return args
+
+
+if __name__ == '__main__':
+    script.setup()
+    args = parse_args()
+    args.run(args)
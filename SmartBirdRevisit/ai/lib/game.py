@@ -1,179 +1,167 @@
 import pygame
-import random
 import os
-import time
 import sys
 
-# game_refactored.py
-import pygame
-import random
-import os
-import sys
+from lib import engine
+from lib.engine import WIN_WIDTH, WIN_HEIGHT, FLOOR_Y, Bird, Pipe, Base, World
 
 pygame.font.init()
 
 # --- Constants ---
-WIN_WIDTH = 600
-WIN_HEIGHT = 800
-FLOOR_Y = 730
 FPS = 30
 
-STAT_FONT = pygame.font.Font("./font/flappy-bird-font.ttf", 25)
-END_FONT = pygame.font.SysFont("comicsans", 50)
-
 DRAW_LINES = False
 
-# --- Window setup ---
-win = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
-pygame.display.set_caption("Smart Bird")
-
-# --- Image assets ---
-pipe_img = pygame.transform.scale2x(pygame.image.load(os.path.join("imgs", "pipe.png")).convert_alpha())
-bg_img = pygame.transform.scale(pygame.image.load(os.path.join("imgs", "bg.png")).convert_alpha(), (WIN_WIDTH, 900))
-bird_images = [
-    pygame.transform.scale2x(pygame.image.load(os.path.join("imgs", f"bird{x}.png")))
-    for x in range(1, 4)
-]
-base_img = pygame.transform.scale2x(pygame.image.load(os.path.join("imgs", "base.png")).convert_alpha())
-
-lives_img = pygame.transform.scale(pygame.image.load(os.path.join("imgs", "lives.png")).convert_alpha(), (160, 56))
-neuron_img = pygame.transform.scale(pygame.image.load(os.path.join("imgs", "neuron.png")).convert_alpha(), (160, 56))
-epoch_img = pygame.transform.scale(pygame.image.load(os.path.join("imgs", "epoch.png")).convert_alpha(), (160, 56))
-blank_img = pygame.transform.scale(pygame.image.load(os.path.join("imgs", "blank.png")).convert_alpha(), (160, 56))
-
-
-# --- Classes ---
-class Bird:
-    MAX_ROTATION = 25
-    ROT_VEL = 20
-    ANIMATION_TIME = 5
-
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.tilt = 0
-        self.tick_count = 0
-        self.velocity = 0
-        self.height = y
-        self.img_count = 0
-        self.img = bird_images[0]
-
-    def jump(self):
-        self.velocity = 7.7
-        self.tick_count = 0
-        self.height = self.y
-
-    def update_position(self):
-        direction = 1 if self.velocity >= 0 else -1
-        displacement = (self.velocity ** 2) * 0.6 * direction if self.velocity > -7 else 20 * 1.25
-        self.y -= displacement
-        self.velocity -= 1.1
-
-        if self.y < self.height and self.tilt < self.MAX_ROTATION:
-            self.tilt = self.MAX_ROTATION
-        elif self.y >= self.height and self.tilt > -90:
-            self.tilt -= self.ROT_VEL
-
-    def draw(self, window):
-        self.img_count += 1
-        if self.img_count <= self.ANIMATION_TIME:
-            self.img = bird_images[0]
-        elif self.img_count <= self.ANIMATION_TIME * 2:
-            self.img = bird_images[1]
-        elif self.img_count <= self.ANIMATION_TIME * 3:
-            self.img = bird_images[2]
-        elif self.img_count <= self.ANIMATION_TIME * 4:
-            self.img = bird_images[1]
-        else:
-            self.img = bird_images[0]
-            self.img_count = 0
-
-        if self.tilt <= -80:
-            self.img = bird_images[1]
-            self.img_count = self.ANIMATION_TIME * 2
-
-        blit_rotate_center(window, self.img, (self.x, self.y), self.tilt)
-
-    def get_mask(self):
-        return pygame.mask.from_surface(self.img)
-
-
-class Pipe:
-    GAP = 200
-    VELOCITY = 8
-
-    def __init__(self, x):
-        self.x = x
-        self.height = 0
-        self.top = 0
-        self.bottom = 0
-        self.PIPE_TOP = pygame.transform.flip(pipe_img, False, True)
-        self.PIPE_BOTTOM = pipe_img
-        self.passed = False
-        self.set_height()
-
-    def set_height(self):
-        self.height = random.randrange(50, 450)
-        self.top = self.height - self.PIPE_TOP.get_height()
-        self.bottom = self.height + self.GAP
-
-    def update_position(self):
-        self.x -= self.VELOCITY
-
-    def draw(self, window):
-        window.blit(self.PIPE_TOP, (self.x, self.top))
-        window.blit(self.PIPE_BOTTOM, (self.x, self.bottom))
-
-    def collide_with_bird(self, bird, window):
-        bird_mask = bird.get_mask()
-        top_mask = pygame.mask.from_surface(self.PIPE_TOP)
-        bottom_mask = pygame.mask.from_surface(self.PIPE_BOTTOM)
-        top_offset = (self.x - bird.x, self.top - round(bird.y))
-        bottom_offset = (self.x - bird.x, self.bottom - round(bird.y))
-
-        return bird_mask.overlap(top_mask, top_offset) or bird_mask.overlap(bottom_mask, bottom_offset)
-
-
-class Base:
-    VELOCITY = 8
-    WIDTH = base_img.get_width()
-    IMG = base_img
-
-    def __init__(self, y):
-        self.y = y
-        self.x1 = 0
-        self.x2 = self.WIDTH
-
-    def update_position(self):
-        self.x1 -= self.VELOCITY
-        self.x2 -= self.VELOCITY
-        if self.x1 + self.WIDTH < 0:
-            self.x1 = self.x2 + self.WIDTH
-        if self.x2 + self.WIDTH < 0:
-            self.x2 = self.x1 + self.WIDTH
-
-    def draw(self, window):
-        window.blit(self.IMG, (self.x1, self.y))
-        window.blit(self.IMG, (self.x2, self.y))
+# --- Window and assets ---
+# Nothing is loaded at import time, so the headless core can run without a display
+win = None
+assets = {}
+masks = {}  # Collision masks keyed by (image, angle), built once per sprite and rotation
+
+
+def init_window():
+    """
+    Open the game window (once) and return it.
+    """
+    global win
+    if win is None:
+        win = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
+        pygame.display.set_caption("Smart Bird")
+    return win
+
+
+def load_assets():
+    """
+    Load every sprite and font (once). Surfaces are only converted to the display format when a window exists.
+    """
+    if assets:
+        return assets
+
+    def load(name, alpha=True):
+        image = pygame.image.load(os.path.join("imgs", name))
+        return image.convert_alpha() if alpha and pygame.display.get_surface() else image
+
+    assets['pipe'] = pygame.transform.scale2x(load("pipe.png"))
+    assets['pipe_top'] = pygame.transform.flip(assets['pipe'], False, True)
+    assets['bg'] = pygame.transform.scale(load("bg.png"), (WIN_WIDTH, 900))
+    assets['birds'] = [pygame.transform.scale2x(load(f"bird{x}.png", alpha=False)) for x in range(1, 4)]
+    assets['base'] = pygame.transform.scale2x(load("base.png"))
+
+    assets['lives'] = pygame.transform.scale(load("lives.png"), (160, 56))
+    assets['neuron'] = pygame.transform.scale(load("neuron.png"), (160, 56))
+    assets['epoch'] = pygame.transform.scale(load("epoch.png"), (160, 56))
+    assets['blank'] = pygame.transform.scale(load("blank.png"), (160, 56))
+
+    assets['stat_font'] = pygame.font.Font("./font/flappy-bird-font.ttf", 25)
+    assets['end_font'] = pygame.font.SysFont("comicsans", 50)
+    return assets
+
+
+# --- Collision ---
+def get_mask(image, angle=0):
+    """
+    Mask of an image at a rotation, only built the first time it is asked for.
+    """
+    key = (image, angle)
+    if key not in masks:
+        rotated = image if angle == 0 else pygame.transform.rotate(image, angle)
+        masks[key] = pygame.mask.from_surface(rotated)
+    return masks[key]
+
+
+def mask_collide(bird, pipe):
+    """
+    Pixel-perfect collision between the bird's current animation sprite and both halves of the pipe.
+    """
+    # Broad phase: the sprite boxes contain every opaque pixel, so the narrow phase only runs when they touch
+    if not engine.box_collide(bird.x, bird.y, pipe.x, pipe.height, engine.BIRD_SPRITE_BOX):
+        return False
+
+    sprites = load_assets()
+    bird_mask = get_mask(sprites['birds'][bird.frame])
+    top_mask = get_mask(sprites['pipe_top'])
+    bottom_mask = get_mask(sprites['pipe'])
+    top_offset = (pipe.x - bird.x, pipe.top - round(bird.y))
+    bottom_offset = (pipe.x - bird.x, pipe.bottom - round(bird.y))
+
+    return bird_mask.overlap(top_mask, top_offset) or bird_mask.overlap(bottom_mask, bottom_offset)
+
+
+def analytic_collide(bird, pipe):
+    """
+    Hitbox collision with plain arithmetic, no masks (see engine.box_collide for its tolerance).
+    """
+    return bool(engine.box_collide(bird.x, bird.y, pipe.x, pipe.height))
+
+
+def hybrid_collide(bird, pipe):
+    """
+    Exact collision that only builds masks on near-miss frames; every other frame is decided by the boxes alone.
+    """
+    if engine.near_miss(bird.x, bird.y, pipe.x, pipe.height):
+        return bool(mask_collide(bird, pipe))
+    return bool(engine.core_collide(bird.x, bird.y, pipe.x, pipe.height))
+
+
+COLLIDERS = {
+    'pixel': mask_collide,
+    'analytic': analytic_collide,
+    'hybrid': hybrid_collide
+}
+
+
+# --- Rendering ---
+def draw_bird(window, bird):
+    return blit_rotate_center(window, load_assets()['birds'][bird.frame], (bird.x, bird.y), bird.tilt)
+
+
+def draw_pipe(window, pipe):
+    sprites = load_assets()
+    return [window.blit(sprites['pipe_top'], (pipe.x, pipe.top)), window.blit(sprites['pipe'], (pipe.x, pipe.bottom))]
+
+
+def draw_base(window, base):
+    image = load_assets()['base']
+    return [window.blit(image, (base.x1, base.y)), window.blit(image, (base.x2, base.y))]
 
 
 # --- Utility functions ---
 def blit_rotate_center(surface, image, topleft, angle):
     rotated_image = pygame.transform.rotate(image, angle)
     new_rect = rotated_image.get_rect(center=image.get_rect(topleft=topleft).center)
-    surface.blit(rotated_image, new_rect.topleft)
-
-
-def draw_window(window, bird, pipes, base, active_pipe_index):
-    window.blit(bg_img, (0, 0))
-    for pipe in pipes:
-        pipe.draw(window)
-    base.draw(window)
-    bird.draw(window)
+    return surface.blit(rotated_image, new_rect.topleft)
+
+
+def render_world(surface, world, restore=None):
+    """
+    Draw one frame of the world onto any surface (the window, or an offscreen surface when running headless).
+    Returns the rectangles the sprites were drawn in. Given restore, the rectangles returned for the previous frame drawn on the
+    same surface, only those are repainted with the background instead of the whole frame, so the frame changed only inside
+    restore plus the returned rectangles (the dirty rectangles, see utility.screen_capture.preprocess_dirty).
+    """
+    background = load_assets()['bg']
+    if restore is None:
+        surface.blit(background, (0, 0))
+    else:
+        for rect in restore:
+            surface.blit(background, rect, rect)                                            # The background sits at (0, 0), so its area is the same rect
+    rects = []
+    for pipe in world.pipes:
+        rects += draw_pipe(surface, pipe)
+    rects += draw_base(surface, world.base)
+    rects.append(draw_bird(surface, world.bird))
+    return rects
+
+
+def draw_window(window, world, restore=None):
+    rects = render_world(window, world, restore)
     pygame.display.update()
+    return rects
 
 
 def show_menu():
+    init_window()
+    load_assets()
     clock = pygame.time.Clock()
     inputs = ["", "", ""]
     active_field = 0
@@ -204,6 +192,7 @@ def show_menu():
                     inputs[active_field] += event.unicode
 
         base.update_position()
+        bird.animate()
         draw_menu_screen(bird, base, inputs)
 
     return num_neurons, num_attempts, num_epochs
@@ -211,16 +200,17 @@ def show_menu():
 
 def draw_menu_screen(bird, base, inputs):
     window = win
-    window.blit(bg_img, (0, 0))
-    base.draw(window)
-    bird.draw(window)
+    sprites = load_assets()
+    window.blit(sprites['bg'], (0, 0))
+    draw_base(window, base)
+    draw_bird(window, bird)
 
-    img_positions = [(neuron_img, inputs[0], 50), (lives_img, inputs[1], 125), (epoch_img, inputs[2], 200)]
+    img_positions = [(sprites['neuron'], inputs[0], 50), (sprites['lives'], inputs[1], 125), (sprites['epoch'], inputs[2], 200)]
 
     for img, text_input, y_pos in img_positions:
         window.blit(img, ((WIN_WIDTH / 2) - img.get_width() - 20, y_pos))
-        window.blit(blank_img, ((WIN_WIDTH / 2) + 20, y_pos))
-        rendered_text = STAT_FONT.render(text_input, 1, (255, 255, 255))
+        window.blit(sprites['blank'], ((WIN_WIDTH / 2) + 20, y_pos))
+        rendered_text = sprites['stat_font'].render(text_input, 1, (255, 255, 255))
         txt_x = ((WIN_WIDTH / 2) + img.get_width() / 2 + 22 - rendered_text.get_width() / 2)
         txt_y = (y_pos + img.get_height() / 2 - rendered_text.get_height() / 2)
         window.blit(rendered_text, (txt_x, txt_y))
@@ -3,33 +3,46 @@ Neural network structuring functions for dealing with the
 Author: Kevin Lee
 """
 import numpy as np
+import os
 import pickle
 
+from lib import checkpoint
+
+CHECKPOINT_DIR = "saved_tp/log"                                                             # Incremental checkpoints written by checkpoint.checkpoint_writer
+STORE_DIR = "saved_tp/store"                                                                # Every generation's best processes, see weight_store
+INDEX_PATH = "saved_tp/index.sqlite"                                                        # Every evaluated attempt of every run, see run_index
+
 class layer:
     """
     LAYER:
     Given certain parameters, design a layer.
     """
     # CONSTRUCTOR: generate the layer structure given the previous layer's no. of outputs(inp), no. of neurons(neu), the pre-defined weights (pre_wei), and the already established biases(est_bia)
-    def __init__ (self, random, no_inputs, no_neurons, pre_weights, est_biases):
+    # dtype: storage precision of the weights and biases; pre-defined ones of another precision (e.g. old float64 pickles) are cast to it
+    # pre_basis: a low-rank factorized layer, inputs . pre_basis (inp x rank) . pre_weights (rank x neu) instead of inputs . pre_weights (inp x neu)
+    def __init__ (self, random, no_inputs, no_neurons, pre_weights, est_biases, dtype=np.float64, pre_basis=None):
         self.inputs = no_inputs
         self.neurons = no_neurons
         self.output = 0
+        self.basis = None if pre_basis is None else np.asarray(pre_basis, dtype=dtype)
+        self.compute_basis = None
+        self.compute_weights = None
+        self.compute_biases = None
         if random:
             # WEIGHTS: Create an array of arrays (according to the number of parameters) in normal distribution:
             # np.random.randn(2, 4)
             # array([[-1.59022344, -0.05409669, -0.40128521,  0.62704859], 
             # [ 0.90419252,  0.83106465, -0.54859216,  1.50170964]])
-            self.weights = np.random.randn(self.inputs, self.neurons)
+            self.weights = np.random.randn(self.inputs, self.neurons).astype(dtype, copy=False)
 
             # BIASES: Unless otherwise pre-established, there should be NO biases being randomly generated:
             # np.zeros((2,4)) <-- NEED BOTH PARENTHESIS, np.zeros() REQUIRES A TUPLE
             # array([[0., 0., 0., 0.],
             # [0., 0., 0., 0.]])
-            self.biases = np.random.randn(1, self.neurons)
+            self.biases = np.random.randn(1, self.neurons).astype(dtype, copy=False)
         else:
-            self.weights = pre_weights
-            self.biases = est_biases
+            self.weights = np.asarray(pre_weights, dtype=dtype)                                # No copy when the precision already matches
+            self.biases = np.asarray(est_biases, dtype=dtype)
 
     # SIGMOID: realigning the output to a number between 0(when x is negative) and 1(when x is positive), with y = 0.5 when x = 0
     def sigmoid (self, x):
@@ -43,8 +56,27 @@ class layer:
     def lrelu(self, x):
         return np.maximum(x, 0.01*x)
 
+    # PREPARE: fold a constant input scale (e.g. 1/255 for raw uint8 pixels) into copies of the weights used by forward, in the compute precision dtype; the saved weights are untouched
+    def prepare (self, input_scale, dtype=np.float32):
+        if self.basis is not None:
+            self.compute_basis = (self.basis * input_scale).astype(dtype)
+            self.compute_weights = self.weights.astype(dtype)
+        else:
+            self.compute_weights = (self.weights * input_scale).astype(dtype)
+        self.compute_biases = np.asarray(self.biases, dtype=dtype)
+
     # FORWARD: calculates this particular layer's outputs using the previous layer's inputs
     def forward (self, inputs):
+        if self.compute_weights is not None:
+            # Cast first: np.dot only reaches BLAS when both sides share a float dtype
+            inputs = inputs.astype(self.compute_weights.dtype, copy=False)
+            if self.compute_basis is not None:
+                inputs = np.dot(inputs, self.compute_basis)
+            self.output = self.lrelu(np.dot(inputs, self.compute_weights) + self.compute_biases)
+            return self.output
+        inputs = inputs.astype(self.weights.dtype, copy=False)
+        if self.basis is not None:
+            inputs = np.dot(inputs, self.basis)
         self.output = self.lrelu(np.dot(inputs, self.weights) + self.biases)
         return self.output
 
@@ -53,15 +85,79 @@ class model:
     MODEL:
     Creates the layers and generates the layer outputs
     """
-    # CONSTRUCTOR: using the model details, construct the neural network model taking in 4800 pixels as inputs, the number of nodes the users wants, and then an output layer with yes or now (2 nodes)
-    def __init__(self, random, best_thought_process, user_input):
+    # CONSTRUCTOR: using the model details, construct the neural network model taking in 4800 pixels (or no_inputs engineered features) as inputs, the number of nodes the users wants, and then an output layer with yes or now (2 nodes)
+    # uint8_inputs: observations arrive as raw 0-255 bytes, the /255 normalisation is folded into the hidden weights and the forward pass runs in float32
+    # storage_dtype: precision the weights are kept (and saved) in; compute_dtype: precision of the forward pass, by default float32 for uint8 inputs or float16 storage (NumPy has no fast float16 matmul), else the storage precision
+    # A thought process with a hidden_basis gets a factorized hidden layer (see thought_process.factorize)
+    def __init__(self, random, best_thought_process, user_input, no_inputs=4800, uint8_inputs=False, storage_dtype=np.float64, compute_dtype=None):
+        storage_dtype = np.dtype(storage_dtype)
+        if compute_dtype is None:
+            compute_dtype = np.float32 if uint8_inputs or storage_dtype == np.float16 else storage_dtype
+        compute_dtype = np.dtype(compute_dtype)
         if random:
             # HIDDEN LAYER: 4800 inputs which is, user_input number of neurons, no pre_weights, no est_biases
-            self.hidden_layer = layer(True, 4800, user_input, 0, 0)
-            self.output_layer = layer(True, user_input, 2, 0, 0)
+            self.hidden_layer = layer(True, no_inputs, user_input, 0, 0, storage_dtype)
+            self.output_layer = layer(True, user_input, 2, 0, 0, storage_dtype)
         else:
-            self.hidden_layer = layer(False, 4800, user_input, best_thought_process['hidden_weights'], best_thought_process['hidden_biases'])
-            self.output_layer = layer(False, user_input, 2, best_thought_process['output_weights'], best_thought_process['output_biases'])
+            self.hidden_layer = layer(False, no_inputs, user_input, best_thought_process['hidden_weights'], best_thought_process['hidden_biases'], storage_dtype,
+                                      best_thought_process.get('hidden_basis'))
+            self.output_layer = layer(False, user_input, 2, best_thought_process['output_weights'], best_thought_process['output_biases'], storage_dtype)
+        if uint8_inputs or compute_dtype != storage_dtype:
+            self.hidden_layer.prepare(1 / 255.0 if uint8_inputs else 1.0, compute_dtype)
+            self.output_layer.prepare(1.0, compute_dtype)
+
+        # Fused inference (see decide): the weights it multiplies and every buffer it writes, set up once per model
+        self.hidden_weights = self.hidden_layer.weights if self.hidden_layer.compute_weights is None else self.hidden_layer.compute_weights
+        self.hidden_basis = self.hidden_layer.basis if self.hidden_layer.compute_basis is None else self.hidden_layer.compute_basis
+        self.input_weights = self.hidden_weights if self.hidden_basis is None else self.hidden_basis     # What the state is multiplied by
+        self.hidden_biases = (self.hidden_layer.biases if self.hidden_layer.compute_biases is None else self.hidden_layer.compute_biases).reshape(-1)
+        self.output_weights = self.output_layer.weights if self.output_layer.compute_weights is None else self.output_layer.compute_weights
+        self.output_biases = (self.output_layer.biases if self.output_layer.compute_biases is None else self.output_layer.compute_biases).reshape(-1)
+        self.input_buffer = np.empty(no_inputs, dtype=self.hidden_weights.dtype)
+        self.hidden_buffer = np.empty(user_input, dtype=self.hidden_weights.dtype)
+        self.projection_buffer = self.hidden_buffer if self.hidden_basis is None else np.empty(self.hidden_basis.shape[1], dtype=self.hidden_weights.dtype)
+        self.leak_buffer = np.empty(user_input, dtype=self.hidden_weights.dtype)
+        self.q_buffer = np.empty(2, dtype=self.output_weights.dtype)
+        self.previous_input = None                                                          # Set by incremental()
+
+    # INCREMENTAL: make decide() update the hidden pre-activation from only the inputs that changed since its last call (W[changed] . delta).
+    # background: a static frame (same layout as the states) whose contribution is computed once, so the first state only pays for what differs from it.
+    # A full matmul is redone when more than max_changed of the inputs changed, or when the rounding error the updates may have piled up exceeds tolerance.
+    # With a factorized hidden layer the rank-sized projection onto the basis is what gets updated
+    def incremental(self, background=None, max_changed=0.25, tolerance=1e-4):
+        dtype = self.hidden_weights.dtype
+        self.previous_input = np.empty(len(self.input_buffer), dtype=dtype)
+        self.pre_activation = np.empty(len(self.projection_buffer), dtype=dtype)
+        self.has_previous = False
+        self.max_changed = int(max_changed * len(self.input_buffer))
+        self.tolerance = tolerance
+        self.drift = 0.0
+        self.drift_scale = np.finfo(dtype).eps * np.abs(self.input_weights).max()           # Bound on the error one unit of |delta| can add
+        self.background = None
+        if background is not None:
+            self.background = np.asarray(background).astype(dtype)
+            self.background_activation = np.dot(self.background, self.input_weights)
+
+    # UPDATE PRE-ACTIVATION: state . input weights (the hidden weights, or the basis of a factorized layer) into self.pre_activation, incrementally where it pays off
+    def update_pre_activation(self, state):
+        if not self.has_previous:
+            if self.background is None:
+                np.dot(state, self.input_weights, out=self.pre_activation)
+                np.copyto(self.previous_input, state)
+                self.has_previous = True
+                return
+            np.copyto(self.previous_input, self.background)
+            np.copyto(self.pre_activation, self.background_activation)
+            self.has_previous = True
+        changed = np.flatnonzero(state != self.previous_input)
+        if len(changed) > self.max_changed or self.drift > self.tolerance:
+            np.dot(state, self.input_weights, out=self.pre_activation)
+            self.drift = 0.0
+        elif len(changed):
+            delta = state[changed] - self.previous_input[changed]
+            self.pre_activation += np.dot(delta, self.input_weights[changed])
+            self.drift += self.drift_scale * np.abs(delta).sum()
+        np.copyto(self.previous_input, state)
 
     # FORWARD: Given the state of the game, calculate the output of the neural network
     def forward(self, state):
@@ -70,13 +166,102 @@ class model:
         output = self.output_layer.forward(hidden_output)
         return output
 
+    # DECIDE: whether to jump in a state (flat, no_inputs long), same as forward(state)[0][0] > forward(state)[0][1] but without allocating:
+    # matmul, bias and leaky ReLU write into the model's buffers, and the layers' outputs are not kept
+    def decide(self, state):
+        if state.dtype != self.input_buffer.dtype:
+            np.copyto(self.input_buffer, state)                                             # e.g. raw uint8 pixels into the float32 compute precision
+            state = self.input_buffer
+        hidden = self.hidden_buffer
+        if self.previous_input is None:
+            projection = np.dot(state, self.input_weights, out=self.projection_buffer)      # Straight into hidden for a dense layer
+        else:
+            self.update_pre_activation(state)
+            projection = self.pre_activation
+        if self.hidden_basis is not None:
+            np.dot(projection, self.hidden_weights, out=hidden)                             # rank x neurons: the cheap second factor
+        elif projection is not hidden:
+            np.copyto(hidden, projection)
+        hidden += self.hidden_biases
+        np.multiply(hidden, 0.01, out=self.leak_buffer)
+        np.maximum(hidden, self.leak_buffer, out=hidden)
+        q_values = self.q_buffer
+        np.dot(hidden, self.output_weights, out=q_values)
+        q_values += self.output_biases
+        return q_values[0] > q_values[1]                                                    # Leaky ReLU is increasing, so the output activation cannot change the decision
+
+class population_model:
+    """
+    POPULATION MODEL:
+    Every individual's weights and biases stacked into 3D tensors, so a whole population decides in one batched matmul
+    """
+    # CONSTRUCTOR: hidden_weights (population, inputs, neurons), hidden_biases (population, 1, neurons), output_weights (population, neurons, 2), output_biases (population, 1, 2)
+    def __init__(self, hidden_weights, hidden_biases, output_weights, output_biases):
+        self.hidden_weights = hidden_weights
+        self.hidden_biases = hidden_biases
+        self.output_weights = output_weights
+        self.output_biases = output_biases
+        self.size = hidden_weights.shape[0]
+
+    # RANDOM: a fresh population, initialised the same way as layer(True, ...)
+    def random(size, no_inputs, no_neurons):
+        return population_model(
+            np.random.randn(size, no_inputs, no_neurons),
+            np.random.randn(size, 1, no_neurons),
+            np.random.randn(size, no_neurons, 2),
+            np.random.randn(size, 1, 2)
+        )
+
+    # FROM THOUGHT PROCESSES: stack a list of thought process dicts (see thought_process.format), factorized ones as their dense product
+    def from_thought_processes(thought_processes):
+        thought_processes = [thought_process.dense(tp) for tp in thought_processes]
+        return population_model(*(
+            np.stack([np.asarray(tp[key]).reshape(shape) for tp in thought_processes])
+            for key, shape in (
+                ('hidden_weights', np.shape(thought_processes[0]['hidden_weights'])),
+                ('hidden_biases', (1, -1)),
+                ('output_weights', np.shape(thought_processes[0]['output_weights'])),
+                ('output_biases', (1, -1))
+            )
+        ))
+
+    # THOUGHT PROCESS: one individual's weights back in the thought process format
+    def thought_process(self, index, fitness_score):
+        return thought_process.format(
+            fitness_score,
+            self.hidden_weights[index],
+            self.hidden_biases[index],
+            self.output_weights[index],
+            self.output_biases[index],
+            self.hidden_weights.shape[2]
+        )
+
+    # LEAKY RELU: same activation as layer.lrelu
+    def lrelu(self, x):
+        return np.maximum(x, 0.01*x)
+
+    # FORWARD: q-values for observations shaped (population, inputs) -- one per individual -- or (population, batch, inputs)
+    def forward(self, observations):
+        batched = observations.ndim == 3
+        if not batched:
+            observations = observations[:, None, :]
+        hidden = self.lrelu(np.matmul(observations, self.hidden_weights) + self.hidden_biases)
+        output = self.lrelu(np.matmul(hidden, self.output_weights) + self.output_biases)
+        return output if batched else output[:, 0, :]
+
+    # DECIDE: boolean jump decisions, True where the first q-value beats the second (as in run_single_simulation)
+    def decide(self, observations):
+        q_values = self.forward(observations)
+        return q_values[..., 0] > q_values[..., 1]
+
 class thought_process:
     """
     THOUGHT PROCESS:
     Combined array of relevant information for saving or continuing training of neural network 
     """
     # FORMAT: Shaping all the necessary information of a neural network required to restart training for a later session
-    def format (fitness_score, hidden_weights, hidden_biases, output_weights, output_biases, user_input):
+    # hidden_basis: the first factor of a factorized hidden layer, whose hidden_weights are then (rank x user_input)
+    def format (fitness_score, hidden_weights, hidden_biases, output_weights, output_biases, user_input, hidden_basis=None):
         thought_process = {
             'fitness_score': fitness_score,
             'hidden_weights': hidden_weights,
@@ -84,20 +269,61 @@ class thought_process:
             'output_weights': output_weights,
             'output_biases': output_biases
         }
+        if hidden_basis is not None:
+            thought_process['hidden_basis'] = hidden_basis
         return thought_process
 
+    # FACTORIZE: a copy of a thought process whose hidden weights (inputs x neurons) are replaced by their best rank approximation from a
+    # truncated SVD, hidden_basis (inputs x rank) . hidden_weights (rank x neurons); the singular values are split evenly between the factors
+    # so mutation noise moves both alike. A factorized thought process is refactorized from its product; rank is capped at the smaller dimension
+    def factorize (best_thought_process, rank):
+        dense = thought_process.dense(best_thought_process)
+        hidden_weights = np.asarray(dense['hidden_weights'])
+        left, singular_values, right = np.linalg.svd(hidden_weights.astype(np.float64), full_matrices=False)
+        scale = np.sqrt(singular_values[:rank])
+        factorized = dict(dense)
+        factorized['hidden_basis'] = (left[:, :rank] * scale).astype(hidden_weights.dtype)
+        factorized['hidden_weights'] = (scale[:, np.newaxis] * right[:rank]).astype(hidden_weights.dtype)
+        return factorized
+
+    # DENSE: a copy of a thought process with a factorized hidden layer multiplied back out; a dense one is returned as it is
+    def dense (best_thought_process):
+        if 'hidden_basis' not in best_thought_process:
+            return best_thought_process
+        dense = {key: value for key, value in best_thought_process.items() if key != 'hidden_basis'}
+        dense['hidden_weights'] = np.dot(best_thought_process['hidden_basis'], best_thought_process['hidden_weights'])
+        return dense
+
     # SAVE: Placing the array in a pickle (.pkl) format
     def save (thought_processes):
         with open("saved_tp/log.pkl", "wb") as f:
             pickle.dump(thought_processes, f)
 
-    # LOAD: Loading the array of the required pickle (.pkl)
-    def load ():
-        with open("saved_tp/log.pkl", "rb") as f:
-            return pickle.load(f)
+    # CAST: a copy of a thought process with its weights and biases in another precision (e.g. old float64 pickles for float32 or float16 storage)
+    def cast (thought_process, dtype):
+        return {key: value if key == 'fitness_score' else np.asarray(value, dtype=dtype) for key, value in thought_process.items()}
+
+    # LOAD: Loading the array of the required pickle (.pkl), or of the incremental checkpoint when one was written, optionally cast to dtype
+    # and remapped to a pruning.input_mask (full-input hidden weights lose the rows of the dropped pixels)
+    def load (dtype=None, input_mask=None):
+        if os.path.exists(os.path.join(CHECKPOINT_DIR, checkpoint.INDEX_FILE)):
+            thought_processes = checkpoint.load(CHECKPOINT_DIR)
+        else:
+            with open("saved_tp/log.pkl", "rb") as f:
+                thought_processes = pickle.load(f)
+        if input_mask is not None:
+            thought_processes = [input_mask.remap(tp) if 'hidden_weights' in tp else tp for tp in thought_processes]
+        if dtype is not None:
+            thought_processes = [thought_process.cast(tp, dtype) for tp in thought_processes]
+        return thought_processes
     
-    # LOAD BEST: Getting the best neural network saved
-    def load_best ():
+    # LOAD BEST: Getting the best neural network saved, optionally cast to dtype and remapped to a pruning.input_mask
+    def load_best (dtype=None, input_mask=None):
         with open("saved_tp/best.pkl", "rb") as f:
             best_thought_processes = pickle.load(f)
-            return best_thought_processes[0]
+            best = best_thought_processes[0]
+            if input_mask is not None:
+                best = input_mask.remap(best)
+            if dtype is not None:
+                best = thought_process.cast(best, dtype)
+            return best
@@ -0,0 +1,182 @@
+"""
+Observation generators that build the network's input straight from game state, without a window or a full-size frame
+Author: Kevin Lee
+"""
+import numpy as np
+import pygame
+
+from lib import engine
+from lib import game
+
+BLOCK_SIZE = 10                                                                             # Same 10x10 block average as utility.preprocess_screen
+PIXEL_COUNT = (engine.WIN_HEIGHT // BLOCK_SIZE) * (engine.WIN_WIDTH // BLOCK_SIZE)          # 4800 inputs for pixel observations
+FEATURE_COUNT = 5                                                                           # Bird y, velocity, next gap top, next gap bottom, distance to the next pipe
+GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114])                                              # cv2.COLOR_RGB2GRAY
+
+
+def gray_and_alpha(surface):
+    """
+    Grayscale values (0-255) and opacity (0-1) of a surface as float (height, width) arrays.
+    """
+    rgb = pygame.surfarray.array3d(surface).astype(np.float64)                              # (width, height, RGB)
+    gray = np.moveaxis(rgb @ GRAY_WEIGHTS, 0, 1)
+    if surface.get_flags() & pygame.SRCALPHA:
+        alpha = np.moveaxis(pygame.surfarray.array_alpha(surface), 0, 1) / 255.0
+    elif surface.get_colorkey() is not None:                                                # The bird sprites are palettized with a transparent color key
+        alpha = np.moveaxis(pygame.surfarray.array_colorkey(surface), 0, 1) / 255.0
+    else:
+        alpha = np.ones_like(gray)
+    return gray, alpha
+
+
+def features(world):
+    """
+    Compact observation of one world, each value scaled to roughly -1..1: bird y, bird velocity,
+    top and bottom of the next gap, and the horizontal distance to the next pipe.
+    """
+    bird = world.bird
+    pipe = world.pipes[world.active_pipe_index()]
+    return np.array([
+        bird.y / engine.WIN_HEIGHT,
+        bird.velocity / 10,
+        pipe.height / engine.WIN_HEIGHT,
+        pipe.bottom / engine.WIN_HEIGHT,
+        (pipe.x - bird.x) / engine.WIN_WIDTH
+    ])
+
+
+def batch_features(batch):
+    """
+    features() for every world of an engine.WorldBatch at once, shaped (size, FEATURE_COUNT).
+    """
+    rows = np.arange(batch.size)
+    slot = batch.active_pipe_index()
+    pipe_height = batch.pipe_height[rows, slot]
+    return np.stack([
+        batch.bird_y / engine.WIN_HEIGHT,
+        batch.velocity / 10,
+        pipe_height / engine.WIN_HEIGHT,
+        (pipe_height + engine.Pipe.GAP) / engine.WIN_HEIGHT,
+        (batch.pipe_x[rows, slot] - engine.BIRD_START_X) / engine.WIN_WIDTH
+    ], axis=1)
+
+
+def block_mean(image, block_size):
+    """
+    Area-average an image whose sides are multiples of block_size (what cv2.INTER_AREA does for integer factors).
+    """
+    height, width = image.shape
+    return image.reshape(height // block_size, block_size, width // block_size, block_size).mean(axis=(1, 3))
+
+
+class sprite_table:
+    """
+    SPRITE TABLE:
+    A sprite pre-downsampled once for every sub-block offset, so drawing it at low resolution is a single blend
+    """
+    # CONSTRUCTOR: for each (oy, ox) offset inside a block, the block-averaged color (gray * alpha) and coverage (alpha) of the sprite
+    def __init__(self, surface, block_size):
+        self.block_size = block_size
+        gray, alpha = gray_and_alpha(surface)
+        height, width = gray.shape
+        rows = -(-(height + block_size - 1) // block_size)                                  # Enough blocks for the largest offset
+        cols = -(-(width + block_size - 1) // block_size)
+        self.color = np.zeros((block_size, block_size, rows, cols))
+        self.cover = np.zeros((block_size, block_size, rows, cols))
+        canvas_color = np.zeros((rows * block_size, cols * block_size))
+        canvas_cover = np.zeros_like(canvas_color)
+        for oy in range(block_size):
+            for ox in range(block_size):
+                canvas_color[:] = 0
+                canvas_cover[:] = 0
+                canvas_color[oy:oy + height, ox:ox + width] = gray * alpha
+                canvas_cover[oy:oy + height, ox:ox + width] = alpha
+                self.color[oy, ox] = block_mean(canvas_color, block_size)
+                self.cover[oy, ox] = block_mean(canvas_cover, block_size)
+
+    # DRAW: blend the sprite into a low resolution frame with its top-left corner at full resolution (x, y), clipped to the frame
+    def draw(self, frame, x, y):
+        block_x, offset_x = divmod(int(x), self.block_size)
+        block_y, offset_y = divmod(int(y), self.block_size)
+        color = self.color[offset_y, offset_x]
+        cover = self.cover[offset_y, offset_x]
+        rows, cols = color.shape
+        top, left = max(block_y, 0), max(block_x, 0)
+        bottom, right = min(block_y + rows, frame.shape[0]), min(block_x + cols, frame.shape[1])
+        if top >= bottom or left >= right:
+            return
+        sprite = (slice(top - block_y, bottom - block_y), slice(left - block_x, right - block_x))
+        target = frame[top:bottom, left:right]
+        target *= 1.0 - cover[sprite]
+        target += color[sprite]
+
+
+class rasterizer:
+    """
+    RASTERIZER:
+    Builds the (WIN_HEIGHT / block_size, WIN_WIDTH / block_size) grayscale observation straight from game state.
+    Numerically close to utility.preprocess_screen on a rendered frame: they only differ inside blocks a sprite edge cuts through
+    (over sample episodes, mean absolute difference ~0.0006 and at most ~0.04 on the 0-1 scale).
+    """
+    # CONSTRUCTOR: downsample the background and every sprite once (no window needed)
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        sprites = game.load_assets()
+        background, _ = gray_and_alpha(sprites['bg'])
+        self.background = block_mean(background[:engine.WIN_HEIGHT, :engine.WIN_WIDTH], block_size)
+        self.pipe_top = sprite_table(sprites['pipe_top'], block_size)
+        self.pipe_bottom = sprite_table(sprites['pipe'], block_size)
+        self.base = sprite_table(sprites['base'], block_size)
+        self.birds = {}                                                                     # Rotated bird tables, built on first use per (frame, tilt)
+        self.frame = np.empty_like(self.background)
+
+    # BIRD: the rotated bird table and its top-left corner, placed exactly like game.blit_rotate_center
+    def bird(self, bird):
+        image = game.load_assets()['birds'][bird.frame]
+        key = (bird.frame, bird.tilt)
+        if key not in self.birds:
+            rotated = pygame.transform.rotate(image, bird.tilt)
+            self.birds[key] = (rotated, sprite_table(rotated, self.block_size))
+        rotated, table = self.birds[key]
+        topleft = rotated.get_rect(center=image.get_rect(topleft=(bird.x, bird.y)).center).topleft
+        return table, topleft
+
+    # RENDER: the low resolution grayscale frame (0-255 floats) of a world, in the same draw order as game.render_world
+    def render(self, world):
+        frame = self.frame
+        frame[:] = self.background
+        for pipe in world.pipes:
+            self.pipe_top.draw(frame, pipe.x, pipe.top)
+            self.pipe_bottom.draw(frame, pipe.x, pipe.bottom)
+        self.base.draw(frame, world.base.x1, world.base.y)
+        self.base.draw(frame, world.base.x2, world.base.y)
+        table, (x, y) = self.bird(world.bird)
+        table.draw(frame, x, y)
+        return frame
+
+    # OBSERVE: flattened into out (allocated if not given), the same layout preprocess_screen returns. Float out is scaled to 0-1, uint8 out keeps the raw 0-255 values
+    def observe(self, world, out=None):
+        frame = self.render(world).reshape(-1)
+        if out is None:
+            return frame / 255.0
+        if out.dtype == np.uint8:
+            return np.rint(frame, out=out, casting='unsafe')
+        return np.multiply(frame, 1 / 255.0, out=out)
+
+
+def random_play(episodes=None, seed=0, raster=None, out=None):
+    """
+    Rasterized observation of every frame of episodes played with random jumps, each episode at its own jump rate
+    (the kind of frames the trainer's early generations see). Endless when episodes is None. With out, every frame is
+    observed into it (see rasterizer.observe) and the same array is yielded each time; else a fresh 0-1 array.
+    """
+    rng = np.random.default_rng(seed)
+    raster = rasterizer() if raster is None else raster
+    episode = 0
+    while episodes is None or episode < episodes:
+        world = engine.World(game.COLLIDERS['analytic'])
+        jump_rate = rng.uniform(0.02, 0.3)
+        while world.playing():
+            yield raster.observe(world, out)
+            world.step(rng.random() < jump_rate)
+        episode += 1
@@ -0,0 +1,215 @@
+"""
+Population storage shared between the trainer and its worker processes
+Author: Kevin Lee
+"""
+import heapq
+import numpy as np
+from multiprocessing import shared_memory
+
+PARAMETERS = ['hidden_weights', 'hidden_biases', 'output_weights', 'output_biases']
+FACTORED_PARAMETERS = ['hidden_basis'] + PARAMETERS                                         # Low-rank hidden layer: inputs . hidden_basis . hidden_weights
+
+
+def parameter_keys(rank=None):
+    """
+    Parameters of a thought process with a dense hidden layer (rank None) or one factorized to rank.
+    """
+    return PARAMETERS if rank is None else FACTORED_PARAMETERS
+
+
+def parameters_of(thought_process):
+    """
+    Parameters the thought process carries: FACTORED_PARAMETERS if its hidden layer is factorized, else PARAMETERS.
+    """
+    return FACTORED_PARAMETERS if 'hidden_basis' in thought_process else PARAMETERS
+
+
+def parameter_shapes(no_inputs, no_neurons, rank=None):
+    """
+    Shape of each parameter of one thought process, in the order of parameter_keys(rank).
+    """
+    if rank is None:
+        return [(no_inputs, no_neurons), (1, no_neurons), (no_neurons, 2), (1, 2)]
+    return [(no_inputs, rank), (rank, no_neurons), (1, no_neurons), (no_neurons, 2), (1, 2)]
+
+
+def attach(name):
+    """
+    Attach to an existing shared memory block without taking ownership of it: only the creating process unlinks it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)                          # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)                                        # Pool workers share their parent's resource tracker, so registering again is harmless
+
+
+class genome_arena:
+    """
+    GENOME ARENA:
+    Preallocated (capacity, ...) tensors for the elite parents and the children in flight, addressed by integer handles.
+    A child starts out sharing its parent's rows and only gets a row of its own for a parameter it changes (copy-on-write).
+    The elites sit in a min-heap, so admitting or rejecting a child is O(log n); a rejected child just hands its rows back.
+    A shared arena keeps the tensors, the handle -> row table and the birth numbers in one multiprocessing.shared_memory block:
+    children are mutated straight into it, and a worker reads a child zero-copy from just its (handle, birth).
+    """
+    # CONSTRUCTOR: capacity handles at most (elites plus children in flight), elite_size of them kept as the best; rank factorizes the hidden layer.
+    # shared: create the tensors in shared memory; name: attach to the shared block of another process' arena, read-only (see spec and read)
+    def __init__(self, capacity, no_inputs, no_neurons, elite_size, dtype='float64', rank=None, shared=False, name=None):
+        self.capacity = capacity
+        self.no_inputs = no_inputs
+        self.no_neurons = no_neurons
+        self.elite_size = elite_size
+        self.dtype = np.dtype(dtype)
+        self.rank = rank
+        self.keys = parameter_keys(rank)
+        self.shapes = dict(zip(self.keys, parameter_shapes(no_inputs, no_neurons, rank)))
+        self.owner = name is None
+        self.memory = None
+        if shared or not self.owner:
+            # Row table and birth numbers first (int64), then the parameter tensors back to back
+            table_size = (len(self.keys) + 1) * capacity * np.dtype(np.int64).itemsize
+            sizes = [capacity * int(np.prod(shape)) * self.dtype.itemsize for shape in self.shapes.values()]
+            self.memory = shared_memory.SharedMemory(create=True, size=table_size + sum(sizes)) if self.owner else attach(name)
+            table = np.ndarray((len(self.keys) + 1, capacity), dtype=np.int64, buffer=self.memory.buf)
+            self.rows = dict(zip(self.keys, table))                                         # Handle -> its row of each parameter
+            self.born = table[-1]                                                           # Birth order, to rank equal fitness like a stable sort
+            self.parameters = {}
+            offset = table_size
+            for (key, shape), size in zip(self.shapes.items(), sizes):
+                self.parameters[key] = np.ndarray((capacity,) + shape, dtype=self.dtype, buffer=self.memory.buf, offset=offset)
+                offset += size
+            if not self.owner:
+                return                                                                      # A worker only reads children
+            for rows in self.rows.values():
+                rows[:] = -1
+        else:
+            self.parameters = {key: np.zeros((capacity,) + shape, dtype=self.dtype) for key, shape in self.shapes.items()}
+            self.rows = {key: np.full(capacity, -1, dtype=np.int64) for key in self.keys}   # Handle -> its row of each parameter
+            self.born = np.zeros(capacity, dtype=np.int64)                                  # Birth order, to rank equal fitness like a stable sort
+        self.references = {key: np.zeros(capacity, dtype=np.int64) for key in self.keys}    # Handles reading each row
+        self.free_rows = {key: list(range(capacity - 1, -1, -1)) for key in self.keys}
+        self.free_handles = list(range(capacity - 1, -1, -1))
+        self.fitness = np.zeros(capacity)
+        self.births = 0
+        self.elites = []                                                                    # Heap of (fitness, -birth, handle): the worst elite on top
+        self.ranking = []
+        # Scratch for mutating one parameter of a slab of children, reused by every slab and only grown for a larger one (see scratch)
+        self.draws = {key: np.empty((1,) + shape, dtype=np.float32) for key, shape in self.shapes.items()}
+        self.masks = {key: np.empty((1,) + shape, dtype=bool) for key, shape in self.shapes.items()}
+
+    # SCRATCH: (count, ...) float32 draw and bool mask buffers for one parameter of count children
+    def scratch(self, key, count):
+        if len(self.draws[key]) < count:
+            self.draws[key] = np.empty((count,) + self.shapes[key], dtype=np.float32)
+            self.masks[key] = np.empty((count,) + self.shapes[key], dtype=bool)
+        return self.draws[key][:count], self.masks[key][:count]
+
+    # SPEC: everything a worker process needs to attach to this (shared) arena
+    def spec(self):
+        return dict(capacity=self.capacity, no_inputs=self.no_inputs, no_neurons=self.no_neurons, elite_size=self.elite_size,
+                    dtype=self.dtype.str, rank=self.rank, name=self.memory.name)
+
+    # READ: a child's parameters as zero-copy views, in a worker attached to the arena. birth is the handle's birth number when it was sent,
+    # so a handle that was released and handed out again since raises instead of being read
+    def read(self, handle, birth):
+        if self.born[handle] != birth:
+            raise RuntimeError(f"genome {handle} was born {self.born[handle]}, expected {birth}")
+        return self.view(handle)
+
+    # CLOSE: drop this process' mapping of a shared arena; the creating process also frees the block
+    def close(self):
+        if self.memory is None:
+            return
+        self.parameters = {}
+        self.rows = {}
+        self.born = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+        self.memory = None
+
+    # NEW HANDLE: take a free handle and give it the next birth number
+    def new_handle(self):
+        if not self.free_handles:
+            raise RuntimeError(f"all {self.capacity} genome handles are in use")
+        handle = self.free_handles.pop()
+        self.born[handle] = self.births
+        self.births += 1
+        return handle
+
+    # ALLOCATE: a handle with rows of its own for every parameter (contents undefined), e.g. for a fresh random model
+    def allocate(self):
+        handle = self.new_handle()
+        for key in self.keys:
+            row = self.free_rows[key].pop()
+            self.references[key][row] = 1
+            self.rows[key][handle] = row
+        return handle
+
+    # SPAWN: a child handle that shares every row of its parent until it writes to them (see materialize)
+    def spawn(self, parent):
+        handle = self.new_handle()
+        for key in self.keys:
+            row = self.rows[key][parent]
+            self.references[key][row] += 1
+            self.rows[key][handle] = row
+        return handle
+
+    # MATERIALIZE: a writable view of the handle's parameter, copying the shared row into a row of its own first if needed
+    def materialize(self, handle, key):
+        row = self.rows[key][handle]
+        if self.references[key][row] > 1:
+            self.references[key][row] -= 1
+            new_row = self.free_rows[key].pop()
+            self.parameters[key][new_row] = self.parameters[key][row]
+            self.references[key][new_row] = 1
+            self.rows[key][handle] = row = new_row
+        return self.parameters[key][row]
+
+    # VIEW: the handle's parameters as views of the arena (write only to what materialize returned)
+    def view(self, handle):
+        return {key: self.parameters[key][self.rows[key][handle]] for key in self.keys}
+
+    # THOUGHT PROCESS: an owned copy of the handle, safe to keep after the handle is released
+    def thought_process(self, handle):
+        thought_process = {key: value.copy() for key, value in self.view(handle).items()}
+        thought_process['fitness_score'] = self.fitness[handle].item()
+        return thought_process
+
+    # RELEASE: give the handle back, and every row no other handle reads
+    def release(self, handle):
+        for key in self.keys:
+            row = self.rows[key][handle]
+            self.references[key][row] -= 1
+            if self.references[key][row] == 0:
+                self.free_rows[key].append(row)
+            self.rows[key][handle] = -1
+        self.free_handles.append(handle)
+
+    # OFFER: admit the evaluated handle to the elites if it beats the worst one (which is then released), else release it
+    def offer(self, handle, fitness_score):
+        self.fitness[handle] = fitness_score
+        entry = (fitness_score, -self.born[handle].item(), handle)
+        if len(self.elites) < self.elite_size:
+            heapq.heappush(self.elites, entry)
+        elif entry > self.elites[0]:
+            self.release(heapq.heapreplace(self.elites, entry)[2])
+        else:
+            self.release(handle)
+            return False
+        self.ranking = None
+        return True
+
+    # RESCORE: replace the fitness of elites re-evaluated on another course (handle -> fitness) and re-rank them
+    def rescore(self, fitness_scores):
+        for handle, fitness_score in fitness_scores.items():
+            self.fitness[handle] = fitness_score
+        self.elites = [(self.fitness[handle].item(), -self.born[handle].item(), handle) for _, _, handle in self.elites]
+        heapq.heapify(self.elites)
+        self.ranking = None
+
+    # RANKED: elite handles, best first (recomputed only after an admission)
+    def ranked(self):
+        if self.ranking is None:
+            self.ranking = [handle for _, _, handle in sorted(self.elites, reverse=True)]
+        return self.ranking
@@ -0,0 +1,113 @@
+"""
+Static input-pixel pruning: profile which observation pixels actually change, and drop the hidden weights of those that do not
+Author: Kevin Lee
+"""
+import argparse
+import os
+import pickle
+import sys
+import numpy as np
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))         # Run from anywhere: python lib/pruning.py
+from lib import observation
+from lib import script
+
+MASK_PATH = "saved_tp/input_mask.npz"
+VARIANCE_THRESHOLD = 1e-5                                                                   # On the 0-1 scale: a standard deviation under ~0.8 gray levels
+
+
+class input_mask:
+    """
+    INPUT MASK:
+    Which observation inputs the network reads. The dropped ones are treated as constant at their profiled mean,
+    so a full-input thought process is remapped by folding their contribution into the hidden biases.
+    """
+    # CONSTRUCTOR: keep (bool per full input) and the mean of every full input on the 0-1 scale
+    def __init__(self, keep, means):
+        self.keep = np.asarray(keep, dtype=bool)
+        self.means = np.asarray(means, dtype=np.float64)
+        self.indices = np.flatnonzero(self.keep)
+        self.no_inputs = len(self.indices)
+
+    # FROM PROFILE: keep the inputs whose variance is above threshold
+    def from_profile(means, variances, threshold=VARIANCE_THRESHOLD):
+        return input_mask(np.asarray(variances) > threshold, means)
+
+    # SAVE / LOAD: as a .npz next to the saved thought processes
+    def save(self, path=MASK_PATH):
+        np.savez(path, keep=self.keep, means=self.means)
+
+    def load(path=MASK_PATH):
+        with np.load(path) as data:
+            return input_mask(data['keep'], data['means'])
+
+    # COMPACT: the kept inputs of a full observation, into out (allocated if not given)
+    def compact(self, state, out=None):
+        return np.take(state, self.indices, out=out)
+
+    # REMAP: a thought process for the compacted input. Full-input weights (e.g. an old best.pkl) lose the rows of dropped inputs,
+    # whose constant contribution moves into the hidden biases; an already compacted thought process is returned as it is.
+    # A factorized hidden layer loses the rows of its basis instead
+    def remap(self, thought_process):
+        key = 'hidden_basis' if 'hidden_basis' in thought_process else 'hidden_weights'
+        input_weights = np.asarray(thought_process[key])
+        if input_weights.shape[0] == self.no_inputs:
+            return thought_process
+        if input_weights.shape[0] != len(self.keep):
+            raise ValueError(f"{key} has {input_weights.shape[0]} inputs, expected {len(self.keep)} or {self.no_inputs}")
+        dropped = self.means[~self.keep] @ input_weights[~self.keep]
+        if key == 'hidden_basis':
+            dropped = dropped @ thought_process['hidden_weights']
+        remapped = dict(thought_process)
+        remapped[key] = input_weights[self.indices]
+        remapped['hidden_biases'] = thought_process['hidden_biases'] + dropped
+        return remapped
+
+
+def profile(episodes, seed=0):
+    """
+    Per-pixel mean and variance (0-1 scale) of the observations of episodes of observation.random_play.
+    """
+    sums = np.zeros(observation.PIXEL_COUNT)
+    squares = np.zeros(observation.PIXEL_COUNT)
+    count = 0
+    for frame in observation.random_play(episodes, seed, out=np.empty(observation.PIXEL_COUNT)):
+        sums += frame
+        squares += frame * frame
+        count += 1
+    means = sums / count
+    return means, np.maximum(squares / count - means * means, 0), count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Profile observation pixels and prune the static ones")
+    commands = parser.add_subparsers(dest='command', required=True)
+    profile_command = commands.add_parser('profile', help="write an input mask from sample episodes")
+    profile_command.add_argument('--episodes', type=int, default=200)
+    profile_command.add_argument('--threshold', type=float, default=VARIANCE_THRESHOLD, help="minimum variance (0-1 scale) of a kept pixel")
+    profile_command.add_argument('--seed', type=int, default=0)
+    profile_command.add_argument('--output', default=MASK_PATH)
+    remap_command = commands.add_parser('remap', help="remap a pickle of full-input thought processes (e.g. best.pkl) to a mask")
+    remap_command.add_argument('input')
+    remap_command.add_argument('output')
+    remap_command.add_argument('--mask', default=MASK_PATH)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    script.setup()
+    args = parse_args()
+    if args.command == 'profile':
+        means, variances, frames = profile(args.episodes, args.seed)
+        mask = input_mask.from_profile(means, variances, args.threshold)
+        mask.save(args.output)
+        print(f"{frames} frames profiled: keeping {mask.no_inputs} of {len(mask.keep)} inputs, mask written to {args.output}")
+    else:
+        mask = input_mask.load(args.mask)
+        with open(args.input, "rb") as f:
+            thought_processes = pickle.load(f)
+        remapped = [mask.remap(tp) if 'hidden_weights' in tp else tp for tp in thought_processes]
+        with open(args.output, "wb") as f:
+            pickle.dump(remapped, f)
+        print(f"{len(remapped)} thought processes remapped to {mask.no_inputs} inputs, written to {args.output}")
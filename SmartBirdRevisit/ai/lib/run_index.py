@@ -0,0 +1,95 @@
+"""
+SQLite index of every run and every evaluated thought process, for leaderboard and history queries
+Author: Kevin Lee
+"""
+import json
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    no_neurons INTEGER NOT NULL,
+    settings TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS individuals (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    epoch INTEGER NOT NULL,
+    attempt INTEGER NOT NULL,
+    fitness REAL NOT NULL,
+    no_neurons INTEGER NOT NULL,
+    evaluated REAL NOT NULL,
+    store_dir TEXT,
+    store_row INTEGER
+);
+CREATE INDEX IF NOT EXISTS individuals_fitness ON individuals (no_neurons, fitness DESC);
+CREATE INDEX IF NOT EXISTS individuals_run ON individuals (run_id, epoch);
+"""
+
+
+class run_index:
+    """
+    RUN INDEX:
+    One row per run and one per evaluated attempt. Weights stay in a weight_store; an individual's row only points at them
+    (store_dir, store_row) once it has been archived, so queries never touch the weights.
+    """
+    # CONSTRUCTOR: open (or create) the index database at path
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    # START RUN: register a run and return its id
+    def start_run(self, no_neurons, settings):
+        cursor = self.connection.execute("INSERT INTO runs (started, no_neurons, settings) VALUES (?, ?, ?)",
+                                         (time.time(), no_neurons, json.dumps(settings, sort_keys=True)))
+        self.connection.commit()
+        return cursor.lastrowid
+
+    # RECORD: add one evaluated attempt and return its id (committed with the next commit)
+    def record(self, run_id, epoch, attempt, fitness, no_neurons):
+        cursor = self.connection.execute("INSERT INTO individuals (run_id, epoch, attempt, fitness, no_neurons, evaluated) VALUES (?, ?, ?, ?, ?, ?)",
+                                         (run_id, epoch, attempt, fitness, no_neurons, time.time()))
+        return cursor.lastrowid
+
+    # LINK: point an individual at its weights in a weight_store
+    def link(self, individual_id, store_dir, store_row):
+        self.connection.execute("UPDATE individuals SET store_dir = ?, store_row = ? WHERE id = ?", (store_dir, store_row, individual_id))
+
+    # COMMIT: make the recorded attempts durable (once per epoch rather than per attempt)
+    def commit(self):
+        self.connection.commit()
+
+    # TOP: the k fittest individuals, optionally restricted to a neuron count or a run
+    def top(self, k, no_neurons=None, run_id=None):
+        conditions, parameters = [], []
+        if no_neurons is not None:
+            conditions.append("no_neurons = ?")
+            parameters.append(no_neurons)
+        if run_id is not None:
+            conditions.append("run_id = ?")
+            parameters.append(run_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self.connection.execute(f"SELECT * FROM individuals {where} ORDER BY fitness DESC, id LIMIT ?", parameters + [k]).fetchall()
+
+    # HISTORY: best, mean and count of fitness per epoch of a run
+    def history(self, run_id):
+        return self.connection.execute("SELECT epoch, MAX(fitness) AS best, AVG(fitness) AS mean, COUNT(*) AS attempts FROM individuals "
+                                       "WHERE run_id = ? GROUP BY epoch ORDER BY epoch", (run_id,)).fetchall()
+
+    # RUNS: every run with its attempt count and best fitness, newest first
+    def runs(self):
+        return self.connection.execute("SELECT runs.*, COUNT(individuals.id) AS attempts, MAX(individuals.fitness) AS best FROM runs "
+                                       "LEFT JOIN individuals USING (run_id) GROUP BY runs.run_id ORDER BY runs.run_id DESC").fetchall()
+
+    # LATEST RUN: id of the most recent run, None if there is none
+    def latest_run(self):
+        row = self.connection.execute("SELECT MAX(run_id) FROM runs").fetchone()
+        return row[0]
+
+    # CLOSE: commit and close the database
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
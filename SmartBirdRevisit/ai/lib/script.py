@@ -0,0 +1,16 @@
+"""
+Setup shared by the command line tools in lib (benchmark.py, pruning.py, factorize.py)
+Author: Kevin Lee
+"""
+import os
+
+AI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup():
+    """
+    Run a tool the way the trainer runs: from the ai directory, which asset and saved_tp paths are relative to, and without a window.
+    Called from a tool's __main__ block only, so importing the tool never changes the process' working directory.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')                                      # Assets only, never a window
+    os.chdir(AI_DIR)
@@ -1,16 +1,95 @@
+import argparse
+import os
 import pickle
-import utility
+import sys
+import matplotlib.pyplot as plt
 
-# --- Load the saved thought processes ---
-with open("../saved_tp/best.pkl", "rb") as f:  # Replace with your actual filename
-    thought_processes = pickle.load(f)
+AI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AI_DIR)                                                                  # Run from anywhere: python lib/show.py
+from lib import neural_network
+from lib import utility
+from lib import run_index
+from lib import weight_store
 
-# --- Sort by fitness_score descending ---
-sorted_processes = sorted(thought_processes, key=lambda tp: tp['fitness_score'], reverse=True)
+INDEX_PATH = os.path.join(AI_DIR, "saved_tp", "index.sqlite")
 
-# --- Print top 10 scores ---
-print("Top 10 Fitness Scores:")
-for rank, tp in enumerate(sorted_processes[:10], start=1):
-    print(f"{rank}: {tp['fitness_score']}")
 
-utility.visualize_thought_process(sorted_processes[0])  # Visualize the best thought process
\ No newline at end of file
+def visualize(thought_process):
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(10, 5))
+    utility.visualize_thought_process(fig, ax1, ax2, neural_network.thought_process.dense(thought_process))  # A factorized layer shows as its product
+    plt.show()
+
+
+def show_pickle(k, show):
+    # --- Load the saved thought processes ---
+    with open(os.path.join(AI_DIR, "saved_tp", "best.pkl"), "rb") as f:
+        thought_processes = pickle.load(f)
+
+    # --- Sort by fitness_score descending ---
+    sorted_processes = sorted(thought_processes, key=lambda tp: tp['fitness_score'], reverse=True)
+
+    # --- Print top k scores ---
+    print(f"Top {k} Fitness Scores:")
+    for rank, tp in enumerate(sorted_processes[:k], start=1):
+        print(f"{rank}: {tp['fitness_score']}")
+    if show:
+        visualize(sorted_processes[0])  # Visualize the best thought process
+
+
+def show_top(index, args):
+    # --- Leaderboard straight from the index; weights are only mapped for the individual shown ---
+    rows = index.top(args.k, args.neurons, args.run)
+    print(f"Top {args.k} Fitness Scores (* weights not kept, cannot be shown):")
+    for rank, row in enumerate(rows, start=1):
+        kept = "" if row['store_row'] is not None else " *"
+        print(f"{rank}: {row['fitness']} (run {row['run_id']}, epoch {row['epoch'] + 1}, attempt {row['attempt'] + 1}, {row['no_neurons']} neurons){kept}")
+    if args.show:
+        shown = next((row for row in rows if row['store_row'] is not None), None)
+        if shown is None:
+            print("None of these individuals' weights were kept")
+        else:
+            visualize(weight_store.weight_store(shown['store_dir'], read_only=True).read(shown['store_row']))
+
+
+def show_history(index, args):
+    run_id = index.latest_run() if args.run is None else args.run
+    if run_id is None:
+        print("No runs indexed")
+        return
+    print(f"Run {run_id}:")
+    for row in index.history(run_id):
+        print(f"Epoch {row['epoch'] + 1}: best {row['best']}, mean {row['mean']:.1f} over {row['attempts']} attempts")
+
+
+def show_runs(index, args):
+    for row in index.runs():
+        print(f"Run {row['run_id']}: {row['no_neurons']} neurons, {row['attempts']} attempts, best {row['best']}, settings {row['settings']}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect saved thought processes")
+    commands = parser.add_subparsers(dest='command')
+    top = commands.add_parser('top', help="the fittest individuals across runs (the default)")
+    top.add_argument('-k', type=int, default=10, help="how many to list")
+    top.add_argument('--neurons', type=int, help="only individuals with this many hidden neurons")
+    top.add_argument('--run', type=int, help="only individuals of this run")
+    top.add_argument('--show', action='store_true', help="visualize the best listed individual whose weights were kept")
+    history = commands.add_parser('history', help="best and mean fitness per epoch of a run")
+    history.add_argument('--run', type=int, help="run id (default: the latest run)")
+    commands.add_parser('runs', help="every indexed run")
+    args = parser.parse_args()
+    if args.command is None:
+        args = parser.parse_args(['top', '--show'])
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if not os.path.exists(INDEX_PATH):
+        if args.command != 'top':
+            sys.exit("No run index yet: train with smart_bird.py first")
+        show_pickle(args.k, args.show)  # Runs from before the index
+    else:
+        index = run_index.run_index(INDEX_PATH)
+        {'top': show_top, 'history': show_history, 'runs': show_runs}[args.command](index, args)
+        index.close()
@@ -4,10 +4,19 @@ Author: Kevin Lee
 """
 # utility_refactored.py
 import numpy as np
-import cv2
+import pygame
 import random
 import matplotlib.pyplot as plt
 
+try:
+    import cv2
+except ImportError:                                                                         # OpenCV is optional: screen_capture falls back to NumPy
+    cv2 = None
+
+MUTATION_RATES = np.array([0.1, 0.15, 0.2])                                                 # Share of parameters mutated, by parent rank
+MUTATION_SCALE = 0.5                                                                        # Noise added to a mutated parameter, in standard deviations
+default_rng = np.random.default_rng()                                                       # Used when no generator is passed, e.g. by unseeded runs
+
 def preprocess_screen(screen):
     """
     Convert the game screen to a flattened grayscale array suitable for the neural network.
@@ -21,25 +30,173 @@ def preprocess_screen(screen):
     return resized.flatten() / 255.0                                                        # (height[80], width[60]) ---> (column[1], pixel[4800])
 
 
-def evolve_thought_process(thought_process, num_neurons, rank_index, score):
+class screen_capture:
+    """
+    Allocation-free version of preprocess_screen: reads the surface through a pixels3d view, works in buffers allocated once,
+    and writes the 4800 observation into a caller-provided array. Runs with OpenCV when it is installed, NumPy otherwise.
+    """
+    def __init__(self, width, height, block_size=10, use_cv2=None):
+        self.block_size = block_size
+        self.use_cv2 = cv2 is not None if use_cv2 is None else use_cv2
+        self.out_height = height // block_size
+        self.out_width = width // block_size
+        if self.use_cv2:
+            self.staging = np.empty((height, width, 3), dtype=np.uint8)                     # cv2 needs the (height, width) orientation contiguous
+            self.grayscale = np.empty((height, width), dtype=np.uint8)
+            self.resized = np.empty((self.out_height, self.out_width), dtype=np.uint8)
+        else:
+            self.grayscale = np.empty((width, height), dtype=np.float32)                    # Stays in the surface's (width, height) orientation
+            self.channel = np.empty((width, height), dtype=np.float32)
+            self.block_sums = np.empty((self.out_width, self.out_height), dtype=np.float32)
+
+    def preprocess(self, surface, out=None):
+        """
+        Fill out (out_height * out_width values, allocated as float if not given) with the downsampled grayscale screen.
+        A float out is scaled to 0-1; a uint8 out keeps the raw 0-255 values.
+        """
+        if out is None:
+            out = np.empty(self.out_height * self.out_width)
+        raw = out.dtype == np.uint8
+        pixels = pygame.surfarray.pixels3d(surface)                                         # (width[600], height[800], RGB[3]) view, no copy
+        if self.use_cv2:
+            np.copyto(self.staging, np.moveaxis(pixels, 1, 0))
+            del pixels                                                                      # Unlock the surface as soon as possible so it can be drawn on again
+            cv2.cvtColor(self.staging, cv2.COLOR_RGB2GRAY, dst=self.grayscale)
+            cv2.resize(self.grayscale, (self.out_width, self.out_height), dst=self.resized, interpolation=cv2.INTER_AREA)
+            np.multiply(self.resized.reshape(-1), 1 if raw else 1 / 255.0, out=out, casting='unsafe')
+        else:
+            np.multiply(pixels[..., 0], 0.299, out=self.grayscale)                          # Same weights as cv2.COLOR_RGB2GRAY
+            np.multiply(pixels[..., 1], 0.587, out=self.channel)
+            self.grayscale += self.channel
+            np.multiply(pixels[..., 2], 0.114, out=self.channel)
+            self.grayscale += self.channel
+            del pixels
+            blocks = self.grayscale.reshape(self.out_width, self.block_size, self.out_height, self.block_size)
+            blocks.sum(axis=(1, 3), out=self.block_sums)
+            if raw:
+                self.block_sums *= 1 / self.block_size ** 2
+                np.rint(self.block_sums.T, out=out.reshape(self.out_height, self.out_width), casting='unsafe')
+            else:
+                np.multiply(self.block_sums.T, 1 / (255.0 * self.block_size ** 2), out=out.reshape(self.out_height, self.out_width))
+        return out
+
+    def dirty_blocks(self, rects):
+        """
+        The blocks overlapping rects, as (top, bottom, left, right) block ranges clipped to the observation.
+        Overlapping ranges are merged when their bounding range is no bigger than the two apart (e.g. a sprite's old and new place).
+        """
+        size = self.block_size
+        area = lambda top, bottom, left, right: (bottom - top) * (right - left)
+        ranges = []
+        for rect in rects:
+            top, left = max(rect.top // size, 0), max(rect.left // size, 0)
+            bottom, right = min(-(-rect.bottom // size), self.out_height), min(-(-rect.right // size), self.out_width)
+            if top >= bottom or left >= right:
+                continue
+            merged = True
+            while merged:
+                merged = False
+                for index, (other_top, other_bottom, other_left, other_right) in enumerate(ranges):
+                    union = (min(top, other_top), max(bottom, other_bottom), min(left, other_left), max(right, other_right))
+                    if area(*union) <= area(top, bottom, left, right) + area(other_top, other_bottom, other_left, other_right):
+                        top, bottom, left, right = union
+                        del ranges[index]
+                        merged = True
+                        break
+            ranges.append((top, bottom, left, right))
+        return ranges
+
+    def preprocess_dirty(self, surface, rects, out):
+        """
+        preprocess for a frame that only changed inside rects (pygame.Rects, e.g. from game.render_world) since out was filled:
+        only the blocks overlapping them are recomputed, the rest of out is kept. Same values as preprocess.
+        """
+        raw = out.dtype == np.uint8
+        size = self.block_size
+        observation = out.reshape(self.out_height, self.out_width)
+        pixels = pygame.surfarray.pixels3d(surface)
+        for top, bottom, left, right in self.dirty_blocks(rects):
+            x0, x1, y0, y1 = left * size, right * size, top * size, bottom * size
+            target = observation[top:bottom, left:right]
+            if self.use_cv2:
+                staging = self.staging[y0:y1, x0:x1]
+                np.copyto(staging, np.moveaxis(pixels[x0:x1, y0:y1], 1, 0))
+                grayscale = cv2.cvtColor(staging, cv2.COLOR_RGB2GRAY)                       # INTER_AREA on whole blocks averages each block on its own, as on the full frame
+                resized = cv2.resize(grayscale, (right - left, bottom - top), interpolation=cv2.INTER_AREA)
+                np.multiply(resized, 1 if raw else 1 / 255.0, out=target, casting='unsafe')
+            else:
+                grayscale, channel = self.grayscale[x0:x1, y0:y1], self.channel[x0:x1, y0:y1]
+                np.multiply(pixels[x0:x1, y0:y1, 0], 0.299, out=grayscale)
+                np.multiply(pixels[x0:x1, y0:y1, 1], 0.587, out=channel)
+                grayscale += channel
+                np.multiply(pixels[x0:x1, y0:y1, 2], 0.114, out=channel)
+                grayscale += channel
+                block_sums = self.block_sums[left:right, top:bottom]
+                grayscale.reshape(right - left, size, bottom - top, size).sum(axis=(1, 3), out=block_sums)
+                if raw:
+                    block_sums *= 1 / size ** 2
+                    np.rint(block_sums.T, out=target, casting='unsafe')
+                else:
+                    np.multiply(block_sums.T, 1 / (255.0 * size ** 2), out=target)
+        del pixels
+        return out
+
+
+def mutation_rate(rank_index, score):
+    """
+    Share of a child's parameters to mutate, given its parent's rank and fitness score.
+    """
+    if score < 50:
+        return MUTATION_RATES[rank_index] * 5                                               # Increase mutation rates arbitrarily for scores that dont come close to the pipe
+    if score < 60:
+        return MUTATION_RATES[rank_index] * 2                                               # Increase mutation rates arbitrarily for scores that barely enter the pipe
+    return MUTATION_RATES[rank_index]
+
+
+def evolve_genomes(arena, parents, rank_indices, scores, rng=None):
+    """
+    Spawn a child of each population.genome_arena parent handle and mutate the whole slab of children at once. For each
+    parameter, one draw gives every child's mutation mask (at its parent's rank and score mutation rate) and one more the
+    noise added where the masks hit, instead of outright replacing the parameter. Parents are never modified: a child only
+    gets rows of its own for the parameters its mask hits and keeps sharing the rest. The draws reuse the arena's scratch
+    buffers; only the rows that were hit are gathered, mutated and scattered back.
+    """
+    rng = default_rng if rng is None else rng
+    rates = np.array([mutation_rate(rank_index, score) for rank_index, score in zip(rank_indices, scores)], dtype=np.float32)
+    children = np.array([arena.spawn(parent) for parent in parents], dtype=np.int64)
+    for key in arena.keys:
+        draws, masks = arena.scratch(key, len(children))
+        rng.random(dtype=np.float32, out=draws)
+        np.less(draws, rates.reshape((-1,) + (1,) * (draws.ndim - 1)), out=masks)
+        hit = np.flatnonzero(masks.reshape(len(children), -1).any(axis=1))
+        if not len(hit):
+            continue
+        for child in children[hit]:
+            arena.materialize(child, key)                                                   # Copy-on-write: hit children get rows of their own
+        rows = arena.rows[key][children[hit]]
+        hit_masks = masks[hit]
+        noise = rng.standard_normal(dtype=np.float32, out=draws.reshape(-1)[:np.count_nonzero(hit_masks)])
+        noise *= MUTATION_SCALE
+        mutated = arena.parameters[key][rows]
+        mutated[hit_masks] += noise
+        arena.parameters[key][rows] = mutated
+    return children.tolist()
+
+
+def upsample_thought_process(thought_process, rows, cols, factor):
     """
-    Gradually mutate the top thought_process weights for gradual improvement.
-    Currently works in-place, but ensure copying outside if needed for reproducibility.
+    A thought process for a pixel observation factor times finer in each direction, from one trained on rows x cols block means.
+    Each coarse pixel's hidden weights are spread evenly over the factor x factor fine pixels it averaged, so the hidden layer's
+    pre-activation, and with it every decision, is unchanged on any frame. A factorized hidden layer has its basis upsampled.
     """
-    for layer in ['hidden_weights', 'output_weights', 'hidden_biases', 'output_biases']:
-        param = thought_process[layer].copy()
-        mutation_rates = [0.1, 0.15, 0.2]
-        if score < 50:
-            mutation_rates = np.array(mutation_rates) * 5                                   # Increase mutation rates arbitrarily for scores that dont come close to the pipe
-        elif score < 60:
-            mutation_rates = np.array(mutation_rates) * 2                                   # Increase mutation rates arbitrarily for scores that barely enter the pipe
-        mutation_rate = mutation_rates[rank_index]
-        num_mutations = int(param.size * mutation_rate)
-        if num_mutations > 0:
-            mutation_indices = np.random.choice(param.size, num_mutations, replace=False)
-            param.flat[mutation_indices] += np.random.randn(num_mutations) * 0.5            # Instead of outright replacing, add a small random value to the existing weight/bias (scaled by half a standard deviation)
-        thought_process[layer] = param
-    return thought_process
+    key = 'hidden_basis' if 'hidden_basis' in thought_process else 'hidden_weights'
+    input_weights = np.asarray(thought_process[key])
+    columns = input_weights.shape[1]
+    grid = input_weights.reshape(rows, cols, columns)
+    fine = np.repeat(np.repeat(grid, factor, axis=0), factor, axis=1) / factor ** 2
+    upsampled = dict(thought_process)
+    upsampled[key] = fine.reshape(rows * factor * cols * factor, columns).astype(input_weights.dtype)
+    return upsampled
 
 def visualize_thought_process(fig, ax1, ax2, thought_process):
     """
@@ -0,0 +1,146 @@
+"""
+Columnar, memory-mappable storage of saved thought processes
+Author: Kevin Lee
+"""
+import os
+import numpy as np
+
+from lib.population import parameter_keys, parameters_of, parameter_shapes
+
+META_FILE = "records.bin"
+WEIGHTS_FILE = "weights.f32"
+RECORD = np.dtype([                                                                         # One metadata row per stored thought process
+    ('fitness', np.float64),
+    ('generation', np.int64),
+    ('parent', np.int64),                                                                   # Row of the parent, -1 if unknown
+    ('no_inputs', np.int32),
+    ('no_neurons', np.int32),
+    ('rank', np.int32),                                                                     # Rank of a factorized hidden layer, 0 for a dense one
+    ('block_size', np.int32),                                                               # Pixel block size of the observation, 0 if unknown
+    ('dtype', 'S8'),                                                                        # Precision the weights were trained in, e.g. b'float32'
+    ('offset', np.int64),                                                                   # First float32 of the individual in the weights file
+])
+WEIGHT_DTYPE = np.dtype(np.float32)
+
+
+class weight_store:
+    """
+    WEIGHT STORE:
+    A metadata table plus one contiguous float32 blob per thought process, both append-only. Both files are memory-mapped,
+    so reading every fitness touches only the table and loading one individual touches only its own weights.
+    """
+    # CONSTRUCTOR: open (or create) the store in directory. read_only opens an existing store without touching its files,
+    # so it can be read while a trainer appends to it (a row still being written is simply not counted yet)
+    def __init__(self, directory, read_only=False):
+        self.directory = directory
+        self.read_only = read_only
+        self.meta_path = os.path.join(directory, META_FILE)
+        self.weights_path = os.path.join(directory, WEIGHTS_FILE)
+        self.meta = None
+        self.weights = None
+        if read_only:
+            for path in (self.meta_path, self.weights_path):
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"no weight store in {directory}: {path} is missing")
+        else:
+            os.makedirs(directory, exist_ok=True)
+            for path in (self.meta_path, self.weights_path):
+                open(path, "ab").close()
+            # A row is only appended after its weights, so a torn write leaves at most a partial row and weights no row refers to:
+            # both are dropped, and the weights file ends exactly where the last row's blob does
+            rows = os.path.getsize(self.meta_path) // RECORD.itemsize
+            os.truncate(self.meta_path, rows * RECORD.itemsize)
+            os.truncate(self.weights_path, self.end() * WEIGHT_DTYPE.itemsize)
+
+    # SIZE: number of stored thought processes
+    def __len__(self):
+        return os.path.getsize(self.meta_path) // RECORD.itemsize
+
+    # TABLE: the metadata rows as a read-only memory-mapped structured array
+    def table(self):
+        rows = len(self)
+        if self.meta is None or len(self.meta) != rows:
+            self.meta = np.memmap(self.meta_path, dtype=RECORD, mode='r', shape=(rows,)) if rows else np.empty(0, dtype=RECORD)
+        return self.meta
+
+    # END: first float32 after the last row's blob, where the next blob goes
+    def end(self):
+        table = self.table()
+        if not len(table):
+            return 0
+        return int(table[-1]['offset']) + blob_size(table[-1])
+
+    # APPEND: add one thought process at the end of both files and return its row; a factorized hidden layer keeps its two factors.
+    # parent is the row of the elite it evolved from, block_size that of the observation it was trained on
+    def append(self, thought_process, generation, parent=-1, block_size=0):
+        if self.read_only:
+            raise ValueError(f"the weight store in {self.directory} was opened read-only")
+        keys = parameters_of(thought_process)
+        no_inputs, no_neurons = np.shape(thought_process[keys[0]])[0], np.shape(thought_process['hidden_biases'])[-1]
+        rank = np.shape(thought_process['hidden_basis'])[1] if 'hidden_basis' in thought_process else 0
+        dtype = np.asarray(thought_process['hidden_weights']).dtype.name
+        blob = np.concatenate([np.ravel(thought_process[key]) for key in keys]).astype(WEIGHT_DTYPE)
+        offset = self.end()  # Not the file size: weights left by a failed append belong to no row and are overwritten
+        with open(self.weights_path, "r+b") as f:
+            f.seek(offset * WEIGHT_DTYPE.itemsize)
+            f.write(blob.tobytes())
+        record = np.array([(thought_process['fitness_score'], generation, parent, no_inputs, no_neurons, rank, block_size, dtype, offset)], dtype=RECORD)
+        row = len(self)
+        with open(self.meta_path, "ab") as f:
+            f.write(record.tobytes())
+        return row
+
+    # APPEND GENERATION: add a whole generation, returning the rows; earlier generations are never rewritten
+    def append_generation(self, thought_processes, generation, parents=None, block_size=0):
+        if parents is None:
+            parents = [-1] * len(thought_processes)
+        return [self.append(thought_process, generation, parent, block_size) for thought_process, parent in zip(thought_processes, parents)]
+
+    # READ: the thought process of a row, its arrays float32 views into the memory-mapped weights file (copy=True for owned float64)
+    def read(self, row, copy=False):
+        record = self.table()[row]
+        rank = int(record['rank']) or None
+        shapes = parameter_shapes(int(record['no_inputs']), int(record['no_neurons']), rank)
+        end = int(record['offset']) + blob_size(record)
+        if self.weights is None or len(self.weights) < end:
+            self.weights = np.memmap(self.weights_path, dtype=WEIGHT_DTYPE, mode='r')
+        thought_process = {'fitness_score': record['fitness'].item()}
+        position = int(record['offset'])
+        for key, shape in zip(parameter_keys(rank), shapes):
+            size = int(np.prod(shape))
+            values = self.weights[position:position + size].reshape(shape)
+            thought_process[key] = values.astype(np.float64) if copy else values
+            position += size
+        return thought_process
+
+    # TOP: rows of the k fittest thought processes, best first, optionally only among rows matching a neuron count
+    def top(self, k, no_neurons=None):
+        table = self.table()
+        rows = np.arange(len(table))
+        if no_neurons is not None:
+            rows = rows[table['no_neurons'] == no_neurons]
+        fitness = np.asarray(table['fitness'])[rows]
+        if k < len(rows):
+            best = np.argpartition(-fitness, k)[:k]
+            rows, fitness = rows[best], fitness[best]
+        return rows[np.argsort(-fitness, kind='stable')]
+
+    # LOAD TOP: the k fittest thought processes themselves
+    def load_top(self, k, copy=False):
+        return [self.read(row, copy) for row in self.top(k)]
+
+
+def blob_size(record):
+    """
+    Number of float32 values a metadata row's thought process takes up in the weights file.
+    """
+    shapes = parameter_shapes(int(record['no_inputs']), int(record['no_neurons']), int(record['rank']) or None)
+    return sum(int(np.prod(shape)) for shape in shapes)
+
+
+def from_pickle(thought_processes, directory, generation=0):
+    """
+    Append the individuals of an old log.pkl / best.pkl population (those that carry weights) to the store in directory.
+    """
+    store = weight_store(directory)
+    return store.append_generation([tp for tp in thought_processes if 'hidden_weights' in tp], generation)
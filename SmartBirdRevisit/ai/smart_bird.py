@@ -1,24 +1,90 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
 import pygame
 import numpy as np  # For array manipulation
 import matplotlib.pyplot as plt
 
+from lib import checkpoint
+from lib import engine
 from lib import game
 from lib import utility
 from lib import neural_network
+from lib import observation
+from lib import population
+from lib import pruning
+from lib import run_index
+from lib import weight_store
 
 FPS = 30
 POPULATION_SIZE = 8
+PARENT_COUNT = 3  # Children cycle through the top 3 elites for evolution
+MERGE_WINDOW = 2  # Children alive per worker at most, evaluating or waiting for the attempts before them to be merged
+PROGRESSIVE_BLOCK_SIZES = [40, 20, observation.BLOCK_SIZE]  # 15x20, 30x40, then the full 60x80 observation
+BLAS_THREAD_VARIABLES = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS']
 
 # Game logic:
 
 class Simulation:
-    def __init__(self, num_neurons):
+    def __init__(self, num_neurons, headless=False, fps=FPS, collision='pixel', observation_mode='screen', uint8_observations=False, decision_interval=1,
+                 workers=1, blas_threads=1, shared_weights=False, seed=None, checkpoint_interval=5.0,
+                 storage_dtype='float64', compute_dtype=None, incremental=False,
+                 input_mask=None, block_size=observation.BLOCK_SIZE, rank=None, progressive=None, batch=None):
         self.num_neurons = num_neurons
+        self.storage_dtype = storage_dtype  # Precision the genomes are kept, shared and saved in
+        self.compute_dtype = compute_dtype  # Precision of the forward pass, None for the model's default (see neural_network.model)
+        self.rank = rank  # Factorize the hidden layer into (inputs x rank) . (rank x neurons), None for a dense one
+        self.progressive = progressive  # Epochs trained on each coarse block size before refining, None for the full resolution throughout
+        self.incremental = incremental and observation_mode != 'features'  # Update the hidden layer from the pixels that changed since the last decision
+        self.checkpoint_interval = checkpoint_interval  # Seconds between background saves of the best processes; a crash loses at most this much
+        self.checkpoint = None  # Started on the first save, so worker processes never spawn a writer
+        self.store = None  # Append-only archive of every generation's best processes, opened on the first epoch
+        self.stored = {}  # Parameter identity -> (row, process) of the best processes already archived
+        self.index = None  # SQLite index of every evaluated attempt, opened with the run's first record
+        self.run_id = None
+        self.indexed = {}  # Parameter identity -> (index id, process) of the best processes, to point their rows at the archive
+        self.seed = seed  # Explicit seed: every epoch plays one precomputed course shared by all its attempts, and the run can be reproduced
+        self.epoch = 0
+        self.schedule = None
+        self.rng = np.random.default_rng(seed)  # Fresh random models and mutations, without touching NumPy's global state
+        # Everything a headless worker process needs to build its own copy of this simulation
+        self.worker_settings = dict(num_neurons=num_neurons, collision=collision, observation_mode=observation_mode,
+                                    uint8_observations=uint8_observations, decision_interval=decision_interval,
+                                    storage_dtype=storage_dtype, compute_dtype=compute_dtype, incremental=incremental,
+                                    input_mask=input_mask, block_size=block_size, rank=rank)
+        self.workers = workers  # More than 1 evaluates attempts in a pool of persistent headless processes
+        self.batch = batch  # Play this many children at once in one vectorized engine.WorldBatch (headless, features, analytic collision)
+        self.blas_threads = blas_threads  # BLAS threads per worker, so workers * blas_threads does not oversubscribe the cores
+        self.pool = None
+        self.shared_weights = shared_weights  # Keep the genome arena in shared memory: workers read children in place instead of unpickling them
+        self.decision_interval = decision_interval  # Query the network every k ticks; a jump is applied once, the ticks in between hold no-jump
+        self.collide = game.COLLIDERS[collision]  # pixel: masks every frame, analytic: hitbox arithmetic, hybrid: masks only on near misses
+        self.observation_mode = observation_mode  # screen: grab and downsample the rendered frame, raster: build the 80x60 frame straight from game state, features: a few engineered numbers
+        self.input_mask = None  # Pruned pixel input: the network only reads the pixels the mask keeps
+        if input_mask is not None and observation_mode != 'features':
+            self.input_mask = pruning.input_mask.load(input_mask)
+        self.headless = headless  # Headless: no window, no plots, every frame is rendered offscreen only for the observation
+        self.fps = fps  # None steps the simulation as fast as the CPU allows
         self.best_thought_processes = [
             {'fitness_score': 0} for _ in range (POPULATION_SIZE)
         ]
+        self.genomes = None  # Elites and children in flight, preallocated once the run starts (see population.genome_arena)
+        self.elite_processes = {}  # Elite handle -> owned copy, made once when it joins the best processes
+        self.in_flight = {}  # Attempt index -> handle of the child being evaluated
+        self.parents = []  # (handle, fitness, archive row) of the elites this epoch's children evolve from, pinned at its start
+        self.lineage = {}  # Genome handle -> archive row of the elite it evolved from, -1 for a random one
         self.first_run = True
-        self.window = game.win
+        self.uint8_observations = uint8_observations and observation_mode != 'features'  # Pixels stay raw bytes end to end, the /255 lives in the model's weights
+        self.sprite_rects = None  # Where the last frame drawn on the window put its sprites; None until the window holds one of our frames
+        self.use_resolution(block_size)
+        if headless:
+            game.load_assets()
+            self.window = pygame.Surface((game.WIN_WIDTH, game.WIN_HEIGHT))
+            return
+        self.window = game.init_window()
+        game.load_assets()
         # --- Matplotlib Setup ---
         plt.ion() # Turn on interactive mode (VERY IMPORTANT)
 
@@ -26,114 +92,506 @@ class Simulation:
         self.fig, (self.ax1, self.ax2) = plt.subplots(1, 2, figsize=(10, 5))
         self.fig.show()
 
+    def use_resolution(self, block_size):
+        # Everything that depends on the pixel observation's block size (10: 60x80 pixels, 40: 15x20)
+        self.block_size = block_size
+        pixel_count = (game.WIN_HEIGHT // block_size) * (game.WIN_WIDTH // block_size)
+        if self.observation_mode == 'features':
+            self.num_inputs = observation.FEATURE_COUNT
+        else:
+            self.num_inputs = pixel_count if self.input_mask is None else self.input_mask.no_inputs
+        if self.observation_mode == 'raster':
+            self.rasterizer = observation.rasterizer(block_size)
+        self.capture = utility.screen_capture(game.WIN_WIDTH, game.WIN_HEIGHT, block_size)
+        self.screen_state = np.empty(pixel_count, dtype=np.uint8 if self.uint8_observations else np.float64)  # Reused every frame
+        self.compact_state = np.empty(self.num_inputs, dtype=self.screen_state.dtype)  # The kept pixels of screen_state, with an input mask
+        self.dirty = None  # Rects the window changed in since screen_state was captured; None when it must be captured whole
+        self.background = None  # The observation of the empty background, built on first use by background_state
+
+    def refine(self, block_size):
+        # Progressive resolution: carry on at a finer block size. Each elite's hidden weights are upsampled so it plays as it did
+        # on the coarse observation (a coarse pixel is the mean of the fine ones under it), keeping its fitness
+        if self.genomes is None:
+            self.worker_settings['block_size'] = block_size  # Nothing trained yet: simply start at the finer block size
+            self.use_resolution(block_size)
+            return
+        elites = [self.genomes.thought_process(handle) for handle in self.genomes.ranked()]
+        parent_rows = [self.stored_row(handle) for handle in self.genomes.ranked()]
+        index_ids = [self.indexed.get(parameter_identity(self.elite_processes[handle]), (None,))[0] for handle in self.genomes.ranked()]
+        rows, cols = game.WIN_HEIGHT // self.block_size, game.WIN_WIDTH // self.block_size
+        factor = self.block_size // block_size
+        self.stop_pool()  # Workers and the genome arena are sized for the old resolution
+        self.genomes.close()
+        self.worker_settings['block_size'] = block_size
+        self.use_resolution(block_size)
+        self.genomes = self.new_genomes()
+        self.lineage = {}
+        carried = {}
+        for elite, parent_row, index_id in zip(elites, parent_rows, index_ids):
+            handle = self.genomes.allocate()
+            self.lineage[handle] = parent_row  # The upsampled elite descends from its coarse self
+            carried[handle] = index_id
+            upsampled = utility.upsample_thought_process(elite, rows, cols, factor)
+            for key, value in self.genomes.view(handle).items():
+                value[...] = upsampled[key]
+            self.genomes.offer(handle, elite['fitness_score'])
+        self.elite_processes = {handle: self.genomes.thought_process(handle) for handle in self.genomes.ranked()}
+        self.best_thought_processes = list(self.elite_processes.values())
+        # Each attempt's index row moves on to the weights of its upsampled self, which play the same; the coarse ones stay its parents
+        self.indexed = {parameter_identity(self.elite_processes[handle]): (carried[handle], self.elite_processes[handle])
+                        for handle in self.elite_processes if carried[handle] is not None}
+        self.archive_generation()  # Archived (and linked) at once, so the children they have next epoch can point at them
+        if self.checkpoint is not None:
+            self.checkpoint.submit(self.best_thought_processes)  # The coarse processes on disk could no longer be loaded
+
     def run_epoch(self, num_attempts):
-        for attempt_index in range(num_attempts):
-            selected_index = attempt_index % 3  # Cycle through top 3 for evolution
-            if self.first_run:
-                evolved_process = None
+        self.use_course(None if self.seed is None else [self.seed, self.epoch])  # Common random numbers: the same pipes for every attempt of the epoch
+        if self.genomes is None:
+            self.genomes = self.new_genomes()
+        if self.workers > 1:
+            self.start_pool()
+        if self.schedule is not None and self.genomes.ranked():
+            self.rescore_elites()  # Children are only ever compared with elites scored on the same course
+        # Every child of the epoch evolves from the elites as they stood at its start (spawned handles keep their rows alive even if
+        # they are evicted meanwhile), so neither the number of workers nor the order results arrive in changes a seeded run
+        self.parents = [(self.genomes.spawn(handle), self.genomes.fitness[handle].item(), self.stored_row(handle))
+                        for handle in self.genomes.ranked()[:PARENT_COUNT]]
+        if self.workers > 1:
+            self.run_epoch_parallel(num_attempts)
+        elif self.batch:
+            self.run_epoch_batched(num_attempts)
+        else:
+            for attempt_index in range(num_attempts):
+                handle = self.spawn_attempt(attempt_index)
+                fitness_score = self.run_single_simulation(self.genomes.view(handle))['fitness_score']
+                self.record_attempt(attempt_index, handle, fitness_score)
+        for parent, _, _ in self.parents:
+            self.genomes.release(parent)
+        self.parents = []
+        self.archive_generation()
+        self.epoch += 1
+
+    def rescore_elites(self):
+        # Re-evaluate the elites on this epoch's course, so their fitness and the children's come from the same pipes
+        handles = list(self.genomes.ranked())
+        if self.batch:
+            fitness_scores = self.run_batch_simulation([self.genomes.view(handle) for handle in handles])
+        elif self.pool is None:
+            fitness_scores = [self.run_single_simulation(self.genomes.view(handle))['fitness_score'] for handle in handles]
+        else:
+            results = queue.Queue()
+            for index, handle in enumerate(handles):
+                self.submit(index, handle, results)
+            fitness_scores = [None] * len(handles)
+            for _ in handles:
+                result = results.get()
+                if isinstance(result, BaseException):
+                    raise result
+                index, fitness_score = result
+                fitness_scores[index] = fitness_score
+        self.genomes.rescore(dict(zip(handles, fitness_scores)))
+        for handle, fitness_score in zip(handles, fitness_scores):
+            self.elite_processes[handle]['fitness_score'] = fitness_score  # In place: archived, indexed and checkpointed copies keep their identity
+        self.elite_processes = {handle: self.elite_processes[handle] for handle in self.genomes.ranked()}
+        self.best_thought_processes = list(self.elite_processes.values())
+        if self.checkpoint is not None:
+            self.checkpoint.submit(self.best_thought_processes)
+
+    def new_genomes(self):
+        # Room for the elites, the pinned parents and the children alive at once, in shared memory when the workers read children from it
+        return population.genome_arena(POPULATION_SIZE + PARENT_COUNT + MERGE_WINDOW * self.workers + (self.batch or 0), self.num_inputs, self.num_neurons, POPULATION_SIZE, self.storage_dtype, self.rank,
+                                       shared=self.shared_weights and self.workers > 1)
+
+    def archive_generation(self):
+        # Append the best processes that are new this epoch; survivors from earlier epochs keep their rows
+        if self.store is None:
+            self.store = weight_store.weight_store(neural_network.STORE_DIR)
+        stored = {}
+        for handle, thought_process in self.elite_processes.items():
+            key = parameter_identity(thought_process)
+            if key in self.stored:
+                stored[key] = self.stored[key]
             else:
-                evolved_process = utility.evolve_thought_process(
-                    self.best_thought_processes[selected_index],
-                    self.num_neurons,
-                    selected_index,
-                    self.best_thought_processes[selected_index]['fitness_score']
-                )
-            latest_process = self.run_single_simulation(evolved_process)
-            self.update_best_processes(latest_process)
-            # --- Update the Combined Plot ---
-            utility.visualize_thought_process(
-                self.fig, 
-                self.ax1, 
-                self.ax2, 
-                latest_process
-            )
+                row = self.store.append(thought_process, self.epoch, self.lineage.get(handle, -1), self.block_size)
+                stored[key] = (row, thought_process)  # Holding the process keeps its ids from being reused
+                if key in self.indexed:
+                    self.index.link(self.indexed[key][0], os.path.abspath(neural_network.STORE_DIR), stored[key][0])
+        self.stored = stored
+        self.lineage = {handle: self.lineage[handle] for handle in self.elite_processes if handle in self.lineage}
+        if self.index is not None:
+            self.index.commit()  # One transaction per epoch
 
-            print(f"Attempt {attempt_index + 1}: Score {latest_process['fitness_score']}")
+    def stored_row(self, handle):
+        # Archive row of an elite's process, -1 if it was never archived
+        thought_process = self.elite_processes.get(handle)
+        if thought_process is None:
+            return -1
+        return self.stored.get(parameter_identity(thought_process), (-1,))[0]
 
-    def run_single_simulation(self, thought_process):
-        clock = pygame.time.Clock()
-        bird = game.Bird(210, 350)
-        base = game.Base(game.FLOOR_Y)
-        pipes = [game.Pipe(700)]
-        fitness_score = 0
-        running = True
-
-        if self.first_run:
-            model = neural_network.model(True, 0, self.num_neurons)  # Start fresh random model
+    def use_course(self, course_seed):
+        if course_seed is None:
+            self.schedule = None
+        elif self.schedule is None or self.schedule.seed != course_seed:
+            self.schedule = engine.PipeSchedule(course_seed)
+
+    def course_seed(self):
+        return None if self.schedule is None else self.schedule.seed
+
+    def run_epoch_parallel(self, num_attempts):
+        # Keep every worker busy, but merge results into the best processes in attempt order, as a serial run would.
+        # Finished attempts wait for the ones before them; at most MERGE_WINDOW children per worker are alive at once
+        results = queue.Queue()
+        finished = {}
+        next_attempt = next_merge = 0
+        while next_merge < num_attempts:
+            while (next_attempt < num_attempts and len(self.in_flight) < MERGE_WINDOW * self.workers
+                   and len(self.in_flight) - len(finished) < self.workers):
+                self.submit_attempt(next_attempt, results)
+                next_attempt += 1
+            result = results.get()
+            if isinstance(result, BaseException):
+                raise result
+            attempt_index, fitness_score = result
+            finished[attempt_index] = fitness_score
+            while next_merge in finished:
+                self.record_attempt(next_merge, self.in_flight.pop(next_merge), finished.pop(next_merge))
+                next_merge += 1
+
+    def run_epoch_batched(self, num_attempts):
+        # Children batch at a time: spawned together, played together, then recorded in attempt order as a serial run would.
+        # They all evolve from the pinned parents, so recording a batch's results never changes the children within it
+        for start in range(0, num_attempts, self.batch):
+            attempts = range(start, min(start + self.batch, num_attempts))
+            handles = self.spawn_attempts(attempts)
+            fitness_scores = self.run_batch_simulation([self.genomes.view(handle) for handle in handles])
+            for attempt_index, handle, fitness_score in zip(attempts, handles, fitness_scores):
+                self.record_attempt(attempt_index, handle, fitness_score)
+
+    def submit_attempt(self, attempt_index, results):
+        handle = self.spawn_attempt(attempt_index)
+        self.in_flight[attempt_index] = handle  # Its rows stay put until the result is recorded, however late the pool reads them
+        self.submit(attempt_index, handle, results)
+
+    def submit(self, index, handle, results):
+        # Evaluate a genome in the pool on the current course; (index, fitness) is put in results
+        if self.genomes.memory is not None:
+            # The genome lives in shared memory; the worker only gets its handle and birth number
+            self.pool.apply_async(evaluate_genome, (index, handle, self.genomes.born[handle].item(), self.course_seed()),
+                                  callback=results.put, error_callback=results.put)
         else:
-            model = neural_network.model(False, thought_process, self.num_neurons)
+            self.pool.apply_async(evaluate_attempt, (index, self.genomes.view(handle), self.course_seed()),
+                                  callback=results.put, error_callback=results.put)
+
+    def start_pool(self):
+        if self.pool is not None:
+            return
+        genome_spec = None if self.genomes.memory is None else self.genomes.spec()
+        # BLAS reads its thread count when NumPy is imported, so the spawned workers inherit it through the environment
+        saved = {name: os.environ.get(name) for name in BLAS_THREAD_VARIABLES}
+        os.environ.update({name: str(self.blas_threads) for name in BLAS_THREAD_VARIABLES})
+        try:
+            context = multiprocessing.get_context('spawn')  # Never fork a process that owns a window
+            self.pool = context.Pool(self.workers, initializer=init_worker, initargs=(self.worker_settings, genome_spec))
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
 
-        while running:
-            clock.tick(FPS)
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
+    def stop_pool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
 
-            active_pipe_index = 0
-            if len(pipes) > 1 and bird.x > pipes[0].x + pipes[0].PIPE_TOP.get_width():
-                active_pipe_index = 1
+    def close(self):
+        self.stop_pool()
+        if self.genomes is not None:
+            self.genomes.close()  # Frees a shared arena's block
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+        if self.checkpoint is not None:
+            self.checkpoint.close()  # Flushes the latest best processes
+            self.checkpoint = None
 
-            if bird.y + bird.img.get_height() >= game.FLOOR_Y or bird.y < -220:
-                break
+    def spawn_attempt(self, attempt_index):
+        return self.spawn_attempts([attempt_index])[0]
 
-            bird.update_position()
-            base.update_position()
+    def spawn_attempts(self, attempt_indices):
+        # A genome handle per attempt: fresh random models on the first run, else copy-on-write children of the pinned parents,
+        # spawned and mutated as one slab (see utility.evolve_genomes)
+        if self.first_run or not self.parents:
+            handles = []
+            for _ in attempt_indices:
+                handle = self.genomes.allocate()
+                self.lineage[handle] = -1
+                for value in self.genomes.view(handle).values():
+                    value[...] = self.rng.standard_normal(value.shape)  # Distributed as neural_network.model(True, ...)'s weights
+                if self.rank is not None:
+                    self.genomes.view(handle)['hidden_basis'] /= np.sqrt(self.rank)  # Entries of the product get unit variance, like dense hidden weights
+                handles.append(handle)
+            return handles
+        selected = [attempt_index % len(self.parents) for attempt_index in attempt_indices]  # Cycle through top 3 for evolution
+        parents = [self.parents[selected_index] for selected_index in selected]
+        handles = utility.evolve_genomes(self.genomes, [parent for parent, _, _ in parents], selected,
+                                         [fitness_score for _, fitness_score, _ in parents], rng=self.rng)
+        for handle, (_, _, parent_row) in zip(handles, parents):
+            self.lineage[handle] = parent_row  # Carried to the archive if the child becomes an elite
+        return handles
 
-            should_add_pipe = False
-            pipes_to_remove = []
+    def record_attempt(self, attempt_index, handle, fitness_score):
+        # --- Update the Combined Plot ---
+        if not self.headless:
+            utility.visualize_thought_process(
+                self.fig, 
+                self.ax1, 
+                self.ax2, 
+                neural_network.thought_process.dense(self.genomes.view(handle))  # A factorized layer shows as its product
+            )
+        if self.genomes.offer(handle, fitness_score):  # O(log n); a rejected child's rows are simply reused
+            latest_process = self.update_best_processes(handle)
+        else:
+            latest_process = {'fitness_score': fitness_score}
+        self.index_attempt(attempt_index, latest_process)
 
-            screen_state = utility.preprocess_screen(pygame.surfarray.array3d(self.window))
+        print(f"Attempt {attempt_index + 1}: Score {fitness_score}")
 
-            for pipe in pipes:
-                pipe.update_position()
-                if pipe.collide_with_bird(bird, self.window):
-                    running = False
-                    break
+    def index_attempt(self, attempt_index, latest_process):
+        if self.index is None:
+            self.index = run_index.run_index(neural_network.INDEX_PATH)
+            self.run_id = self.index.start_run(self.num_neurons, dict(self.worker_settings, seed=self.seed, workers=self.workers,
+                                                                           progressive=self.progressive, batch=self.batch,
+                                                                           shared_weights=self.shared_weights))
+        individual_id = self.index.record(self.run_id, self.epoch, attempt_index, latest_process['fitness_score'], self.num_neurons)
+        # Only the best processes can be archived, so only their index ids are kept
+        best = {id(thought_process) for thought_process in self.best_thought_processes}
+        self.indexed = {key: entry for key, entry in self.indexed.items() if id(entry[1]) in best}
+        if id(latest_process) in best and 'hidden_weights' in latest_process:
+            self.indexed[parameter_identity(latest_process)] = (individual_id, latest_process)
 
-                if pipe.x + pipe.PIPE_TOP.get_width() < 0:
-                    pipes_to_remove.append(pipe)
+    def run_single_simulation(self, thought_process):
+        clock = pygame.time.Clock()
+        world = game.World(self.collide, self.schedule)
 
-                if not pipe.passed and pipe.x < bird.x:
-                    fitness_score += 500  # Reward for passing a pipe
-                    pipe.passed = True
-                    should_add_pipe = True
+        if thought_process is None:
+            model = neural_network.model(True, 0, self.num_neurons, self.num_inputs, self.uint8_observations, self.storage_dtype, self.compute_dtype)  # Start fresh random model
+        else:
+            model = neural_network.model(False, thought_process, self.num_neurons, self.num_inputs, self.uint8_observations, self.storage_dtype, self.compute_dtype)
+        if self.incremental:
+            model.incremental(self.background_state())
 
-            if should_add_pipe:
-                pipes.append(game.Pipe(game.WIN_WIDTH))
+        # Draw the fresh world whole before the first observation: the window may still hold the last episode's frame, or nothing yet
+        self.sprite_rects = None
+        if not self.headless or self.observation_mode == 'screen':
+            self.render(world)
 
-            for pipe in pipes_to_remove:
-                pipes.remove(pipe)
+        tick = 0
+        while world.playing():
+            if self.fps:
+                clock.tick(self.fps)
+            if not self.headless:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        pygame.quit()
+                        sys.exit()
 
-            # Neural network decides whether to jump
-            q_values = model.forward(screen_state)
-            if q_values[0][0] > q_values[0][1]:
-                bird.jump()
+            jump = False
+            if tick % self.decision_interval == 0:
+                # Neural network decides whether to jump
+                jump = model.decide(self.observe(world))  # Fused, allocation-free forward pass
+            world.step(jump)  # Scored every tick, decision or not
+            tick += 1
 
-            fitness_score += 1  # Increment score for survival
-            game.draw_window(self.window, bird, pipes, base, active_pipe_index)
+            if not self.headless or (self.observation_mode == 'screen' and tick % self.decision_interval == 0):
+                self.render(world)  # Headless: offscreen, only needed for the next observation
 
         thought_process_record = neural_network.thought_process.format(
-            fitness_score,
+            world.score,
             model.hidden_layer.weights,
             model.hidden_layer.biases,
             model.output_layer.weights,
             model.output_layer.biases,
-            self.num_neurons
+            self.num_neurons,
+            model.hidden_layer.basis
         )
         return thought_process_record
 
-    def update_best_processes(self, new_process):
-        self.best_thought_processes.append(new_process)
-        self.best_thought_processes.sort(key=lambda x: x['fitness_score'], reverse=True)
-        self.best_thought_processes = self.best_thought_processes[:POPULATION_SIZE]
-        neural_network.thought_process.save(self.best_thought_processes)
+    def run_batch_simulation(self, thought_processes):
+        # The fitness of every thought process's first game, all played at once: one batched forward pass per decision
+        # for the whole population and one vectorized step with analytic collision (see engine.WorldBatch)
+        population_model = neural_network.population_model.from_thought_processes(thought_processes)
+        worlds = engine.WorldBatch(len(thought_processes), schedule=self.schedule)
+        fitness_scores = np.zeros(worlds.size, dtype=np.int64)
+        playing = np.ones(worlds.size, dtype=bool)
+        no_jump = np.zeros(worlds.size, dtype=bool)
+        tick = 0
+        while playing.any():
+            jump = no_jump
+            if tick % self.decision_interval == 0:
+                jump = population_model.decide(observation.batch_features(worlds))
+            done, final_scores = worlds.step(jump)  # A finished world restarts at once; only its first game counts
+            fitness_scores[done & playing] = final_scores[done & playing]
+            playing &= ~done
+            tick += 1
+        return fitness_scores.tolist()
+
+    def observe(self, world):
+        if self.observation_mode == 'features':
+            return observation.features(world)
+        state = self.observe_pixels(world)
+        if self.input_mask is not None:
+            return self.input_mask.compact(state, self.compact_state)
+        return state
+
+    def observe_pixels(self, world):
+        if self.observation_mode == 'raster':
+            return self.rasterizer.observe(world, self.screen_state)
+        # The last frame drawn, i.e. the state before this tick; only the blocks it changed since the last capture are recomputed
+        if self.dirty is None:
+            self.capture.preprocess(self.window, self.screen_state)
+        else:
+            self.capture.preprocess_dirty(self.window, self.dirty, self.screen_state)
+        self.dirty = []
+        return self.screen_state
+
+    def render(self, world):
+        # Repaint only where the previous frame's sprites were, and remember every rect the window changed in
+        restore = self.sprite_rects
+        if self.headless:
+            rects = game.render_world(self.window, world, restore)
+        else:
+            rects = game.draw_window(self.window, world, restore)
+        if restore is None:
+            self.dirty = None
+        elif self.dirty is not None:
+            self.dirty += restore + rects
+        self.sprite_rects = rects
+
+    def background_state(self):
+        # What observe() returns for the background alone, the static part of every pixel observation
+        if self.background is None:
+            if self.observation_mode == 'raster':
+                background = self.rasterizer.background.reshape(-1)
+                self.background = np.rint(background).astype(np.uint8) if self.uint8_observations else background / 255.0
+            else:
+                surface = pygame.Surface((game.WIN_WIDTH, game.WIN_HEIGHT))
+                surface.blit(game.load_assets()['bg'], (0, 0))
+                self.background = self.capture.preprocess(surface, np.empty_like(self.screen_state))
+            if self.input_mask is not None:
+                self.background = self.input_mask.compact(self.background)
+        return self.background
+
+    def update_best_processes(self, handle):
+        # The arena already ranked the new elite; mirror the ranking with owned copies for saving and archiving
+        new_process = self.genomes.thought_process(handle)
+        self.elite_processes[handle] = new_process
+        self.elite_processes = {elite: self.elite_processes[elite] for elite in self.genomes.ranked()}  # Drops the evicted elite
+        self.best_thought_processes = list(self.elite_processes.values())
+        if self.checkpoint is None:
+            self.checkpoint = checkpoint.checkpoint_writer(neural_network.CHECKPOINT_DIR, self.checkpoint_interval)
+        self.checkpoint.submit(self.best_thought_processes)  # Written in the background, only new individuals get a file
+        return new_process
+
+
+def parameter_identity(thought_process):
+    # The ids of a process's arrays: owned copies are made once per elite, so they tell archived processes apart without hashing weights
+    return tuple(id(thought_process[name]) for name in population.parameters_of(thought_process))
+
+
+# --- Parallel evaluation ---
+# Each worker process keeps one headless simulation, warmed up once with its assets and libraries loaded
+worker_simulation = None
+worker_genomes = None
+
+
+def init_worker(settings, genome_spec=None):
+    global worker_simulation, worker_genomes
+    worker_simulation = Simulation(headless=True, fps=None, **settings)
+    if genome_spec is not None:
+        worker_genomes = population.genome_arena(**genome_spec)
+
+
+def evaluate_attempt(attempt_index, thought_process, course_seed=None):
+    worker_simulation.use_course(course_seed)
+    return attempt_index, worker_simulation.run_single_simulation(thought_process)['fitness_score']  # The parent keeps the weights
+
+
+def evaluate_genome(attempt_index, handle, birth, course_seed=None):
+    worker_simulation.use_course(course_seed)
+    thought_process = worker_genomes.read(handle, birth)  # Zero-copy views of the trainer's genome arena
+    return attempt_index, worker_simulation.run_single_simulation(thought_process)['fitness_score']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train smart bird thought processes")
+    parser.add_argument('--headless', action='store_true', help="run without a window or plots (requires --neurons, --attempts and --epochs)")
+    parser.add_argument('--uncapped', action='store_true', help="step the simulation as fast as possible instead of at FPS")
+    parser.add_argument('--collision', choices=sorted(game.COLLIDERS), default='pixel', help="pipe collision mode")
+    parser.add_argument('--observation', choices=['screen', 'raster', 'features'], default='screen', help="network input: pixels grabbed from the screen, pixels rasterized from game state, or a compact feature vector")
+    parser.add_argument('--uint8', action='store_true', help="keep pixel observations as uint8 and run the network in float32")
+    parser.add_argument('--storage-dtype', choices=['float64', 'float32', 'float16'], default='float64', help="precision the weights are kept and saved in")
+    parser.add_argument('--compute-dtype', choices=['float64', 'float32'], help="precision of the forward pass (default: float32 with --uint8 or float16 storage, else the storage precision)")
+    parser.add_argument('--incremental', action='store_true', help="with pixel observations, update the hidden layer from only the pixels that changed (pays off from roughly 64 hidden neurons)")
+    parser.add_argument('--input-mask', metavar='PATH', help="with pixel observations, only feed the network the pixels this mask keeps (see lib/pruning.py profile)")
+    parser.add_argument('--rank', type=int, help="with pixel observations, factorize the hidden layer to this rank: inputs x rank times rank x neurons (see lib/factorize.py)")
+    parser.add_argument('--progressive', type=int, metavar='EPOCHS', help="with pixel observations, train EPOCHS epochs on each coarse resolution (15x20, then 30x40) before the full 60x80")
+    parser.add_argument('--decision-interval', type=int, default=1, metavar='K', help="query the network every K ticks (action repeat)")
+    parser.add_argument('--workers', type=int, default=1, help="evaluate attempts in this many headless worker processes")
+    parser.add_argument('--blas-threads', type=int, default=1, help="BLAS threads per worker process")
+    parser.add_argument('--batch', type=int, metavar='N', help="with --headless, features observations and analytic collision, play N children at once in one vectorized game batch")
+    parser.add_argument('--shared-weights', action='store_true', help="with --workers, pass thought processes through shared memory instead of pickling them")
+    parser.add_argument('--seed', type=int, help="seed the run: each epoch plays one reproducible course shared by all its attempts")
+    parser.add_argument('--checkpoint-interval', type=float, default=5.0, metavar='SECONDS', help="save the best thought processes at most once per interval, in the background")
+    parser.add_argument('--neurons', type=int, help="number of hidden neurons")
+    parser.add_argument('--attempts', type=int, help="attempts per epoch")
+    parser.add_argument('--epochs', type=int, help="number of epochs")
+    args = parser.parse_args()
+    if args.headless and None in (args.neurons, args.attempts, args.epochs):
+        parser.error("--headless requires --neurons, --attempts and --epochs")
+    if args.decision_interval < 1:
+        parser.error("--decision-interval must be at least 1")
+    if args.workers < 1 or args.blas_threads < 1:
+        parser.error("--workers and --blas-threads must be at least 1")
+    if args.checkpoint_interval < 0:
+        parser.error("--checkpoint-interval must not be negative")
+    if args.rank is not None and (args.rank < 1 or args.observation == 'features'):
+        parser.error("--rank must be at least 1 and only applies to pixel observations")
+    if args.progressive is not None and (args.progressive < 1 or args.observation == 'features' or args.input_mask is not None):
+        parser.error("--progressive needs at least 1 epoch per stage, pixel observations and no --input-mask")
+    if args.input_mask is not None and args.observation == 'features':
+        parser.error("--input-mask only applies to pixel observations")
+    if args.incremental and args.observation == 'features':
+        parser.error("--incremental only applies to pixel observations")
+    if args.uint8 and args.observation == 'features':
+        parser.error("--uint8 only applies to pixel observations")
+    if args.batch is not None and (args.batch < 1 or not args.headless or args.observation != 'features' or args.collision != 'analytic' or args.workers > 1):
+        parser.error("--batch must be at least 1 and needs --headless, features observations, analytic collision and a single worker")
+    return args
 
 
 if __name__ == '__main__':
-    num_neurons, num_attempts, num_epochs = game.show_menu()
-    simulation = Simulation(num_neurons)
+    args = parse_args()
+    if args.headless:
+        num_neurons, num_attempts, num_epochs = args.neurons, args.attempts, args.epochs
+    else:
+        num_neurons, num_attempts, num_epochs = game.show_menu()
+    simulation = Simulation(num_neurons, headless=args.headless, fps=None if args.headless or args.uncapped else FPS, collision=args.collision,
+                            observation_mode=args.observation, uint8_observations=args.uint8, decision_interval=args.decision_interval,
+                            workers=args.workers, blas_threads=args.blas_threads, shared_weights=args.shared_weights, seed=args.seed,
+                            checkpoint_interval=args.checkpoint_interval, storage_dtype=args.storage_dtype, compute_dtype=args.compute_dtype,
+                            incremental=args.incremental, input_mask=args.input_mask,
+                            block_size=PROGRESSIVE_BLOCK_SIZES[0] if args.progressive else observation.BLOCK_SIZE,
+                            rank=args.rank, progressive=args.progressive, batch=args.batch)
     for epoch_index in range(num_epochs):
+        if args.progressive:
+            block_size = PROGRESSIVE_BLOCK_SIZES[min(epoch_index // args.progressive, len(PROGRESSIVE_BLOCK_SIZES) - 1)]
+            if block_size != simulation.block_size:
+                simulation.refine(block_size)
         print(f"Epoch {epoch_index + 1}")
         simulation.run_epoch(num_attempts)
         simulation.first_run = False
+    if simulation.block_size != observation.BLOCK_SIZE:
+        simulation.refine(observation.BLOCK_SIZE)  # Too few epochs to reach the last stage: the saved processes still read the full observation
+    simulation.close()
@@ -0,0 +1,37 @@
+"""
+Mutating a slab of children in the genome arena
+Run from SmartBirdRevisit/ai: python -m pytest tests
+Author: Kevin Lee
+"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import population
+from lib import utility
+
+
+def test_evolve_genomes_mutates_a_slab_copy_on_write():
+    arena = population.genome_arena(capacity=12, no_inputs=400, no_neurons=6, elite_size=2)
+    rng = np.random.default_rng(0)
+    parents = [arena.allocate() for _ in range(2)]
+    for parent in parents:
+        for value in arena.view(parent).values():
+            value[...] = rng.standard_normal(value.shape)
+    before = [{key: value.copy() for key, value in arena.view(parent).items()} for parent in parents]
+
+    children = utility.evolve_genomes(arena, [parents[0], parents[1], parents[0]], [0, 1, 2], [70, 70, 70], rng=rng)
+
+    for parent, values in zip(parents, before):
+        for key, value in arena.view(parent).items():
+            np.testing.assert_array_equal(value, values[key])                           # Parents are never modified
+    for child, rank_index, parent in zip(children, [0, 1, 2], [0, 1, 0]):
+        child_values, parent_values = arena.view(child), before[parent]
+        changed = child_values['hidden_weights'] != parent_values['hidden_weights']
+        assert abs(changed.mean() - utility.MUTATION_RATES[rank_index]) < 0.03               # Each child at its own parent's rate
+        for key in arena.keys:
+            if (child_values[key] == parent_values[key]).all():
+                assert arena.rows[key][child] == arena.rows[key][parents[parent]]           # Unmutated parameters stay shared
+            else:
+                assert arena.rows[key][child] != arena.rows[key][parents[parent]]
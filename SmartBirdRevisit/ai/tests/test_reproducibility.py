@@ -0,0 +1,43 @@
+"""
+Seeded runs reproduce exactly, however many worker processes evaluate the attempts
+Run from SmartBirdRevisit/ai: python -m pytest tests
+Author: Kevin Lee
+"""
+import os
+import sys
+
+AI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AI_DIR)
+import smart_bird
+from lib import neural_network
+from lib import run_index
+
+
+def attempt_history(workers):
+    # Fitness of every attempt of a seeded screen-mode run, in (epoch, attempt) order, as the run index recorded it
+    simulation = smart_bird.Simulation(8, headless=True, fps=None, collision='analytic', observation_mode='screen',
+                                       workers=workers, seed=5, checkpoint_interval=0)
+    try:
+        for _ in range(2):
+            simulation.run_epoch(4)
+            simulation.first_run = False
+        run_id = simulation.run_id
+    finally:
+        simulation.close()
+    index = run_index.run_index(neural_network.INDEX_PATH)
+    try:
+        rows = index.connection.execute("SELECT fitness FROM individuals WHERE run_id = ? ORDER BY epoch, attempt", (run_id,)).fetchall()
+    finally:
+        index.close()
+    return [row['fitness'] for row in rows]
+
+
+def test_seeded_screen_run_is_the_same_with_workers(tmp_path, monkeypatch):
+    # Assets are loaded relative to the working directory, and the run saves under it
+    for name in ('imgs', 'font'):
+        os.symlink(os.path.join(AI_DIR, name), tmp_path / name)
+    os.makedirs(tmp_path / 'saved_tp')
+    monkeypatch.chdir(tmp_path)
+    serial = attempt_history(workers=1)
+    assert len(serial) == 8
+    assert attempt_history(workers=2) == serial
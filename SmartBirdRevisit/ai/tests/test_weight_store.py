@@ -0,0 +1,55 @@
+"""
+The weight store keeps every row readable across torn writes
+Run from SmartBirdRevisit/ai: python -m pytest tests
+Author: Kevin Lee
+"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib import weight_store
+
+
+def thought_process(fitness, seed):
+    rng = np.random.default_rng(seed)
+    return {
+        'fitness_score': fitness,
+        'hidden_weights': rng.standard_normal((6, 3)).astype(np.float32),
+        'hidden_biases': rng.standard_normal((1, 3)).astype(np.float32),
+        'output_weights': rng.standard_normal((3, 2)).astype(np.float32),
+        'output_biases': rng.standard_normal((1, 2)).astype(np.float32)
+    }
+
+
+def assert_same(stored, expected):
+    assert stored['fitness_score'] == expected['fitness_score']
+    for key in ('hidden_weights', 'hidden_biases', 'output_weights', 'output_biases'):
+        np.testing.assert_array_equal(stored[key], expected[key])
+
+
+def test_append_after_a_torn_tail(tmp_path):
+    first, second = thought_process(3, 0), thought_process(5, 1)
+    weight_store.weight_store(tmp_path).append(first, 0)
+    # A crash mid-append: part of a blob (not even a whole float32) and part of a row
+    with open(tmp_path / weight_store.WEIGHTS_FILE, "ab") as f:
+        f.write(b"\x01\x02\x03")
+    with open(tmp_path / weight_store.META_FILE, "ab") as f:
+        f.write(b"\x04\x05")
+    store = weight_store.weight_store(tmp_path)
+    assert len(store) == 1
+    assert store.append(second, 1) == 1
+    reopened = weight_store.weight_store(tmp_path, read_only=True)
+    assert_same(reopened.read(0), first)
+    assert_same(reopened.read(1), second)
+
+
+def test_append_after_weights_without_a_row(tmp_path):
+    first, second = thought_process(3, 0), thought_process(5, 1)
+    store = weight_store.weight_store(tmp_path)
+    store.append(first, 0)
+    with open(tmp_path / weight_store.WEIGHTS_FILE, "ab") as f:
+        f.write(np.ones(7, dtype=weight_store.WEIGHT_DTYPE).tobytes())   # Weights written, row never appended
+    store.append(second, 1)
+    assert_same(store.read(1), second)
+    assert os.path.getsize(tmp_path / weight_store.WEIGHTS_FILE) >= store.end() * weight_store.WEIGHT_DTYPE.itemsize